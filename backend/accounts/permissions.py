@@ -6,12 +6,26 @@ ROLE_USUARIO = "usuarios"
 ROLE_CONSULTOR = "consultores"
 
 
+def cache_user_role_names(user, role_names):
+    user._sisas_role_names = frozenset(role_names)
+    return user._sisas_role_names
+
+
+def get_user_role_names(user) -> frozenset:
+    # Los roles se consultan una vez y quedan en el objeto request.user,
+    # que vive lo mismo que la request.
+    role_names = getattr(user, "_sisas_role_names", None)
+    if role_names is None:
+        role_names = cache_user_role_names(user, user.groups.values_list("name", flat=True))
+    return role_names
+
+
 def user_in_group(user, role_name: str) -> bool:
     if not user or not user.is_authenticated:
         return False
     if user.is_superuser or user.is_staff:
         return True if role_name == ROLE_ADMIN else False
-    return user.groups.filter(name=role_name).exists()
+    return role_name in get_user_role_names(user)
 
 
 class IsAdmin(BasePermission):
@@ -40,3 +54,13 @@ class MedicationAccessPermission(BasePermission):
         return user_in_group(request.user, ROLE_ADMIN) or user_in_group(
             request.user, ROLE_USUARIO
         )
+
+
+class ReportAccessPermission(BasePermission):
+    # Encolar un reporte no modifica inventario: los consultores tambien pueden.
+    def has_permission(self, request, view):
+        return (
+            user_in_group(request.user, ROLE_ADMIN)
+            or user_in_group(request.user, ROLE_USUARIO)
+            or user_in_group(request.user, ROLE_CONSULTOR)
+        )
@@ -0,0 +1,149 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, User
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.validators import validate_email
+
+from accounts.models import UserProfile
+
+# Con pocas filas arrancar procesos cuesta mas que calcular los hashes.
+PARALLEL_HASH_MIN_ROWS = 8
+PROVISION_BATCH_SIZE = 500
+TEXT_FIELDS = ["email", "first_name", "last_name", "municipality"]
+
+
+def _init_hasher_process():
+    # Con spawn (Windows) el proceso hijo arranca sin configuracion de Django.
+    import django
+
+    django.setup()
+
+
+def hash_passwords(passwords):
+    """Calcula los hashes en paralelo: PBKDF2 ocupa CPU y no libera el GIL."""
+    workers = min(len(passwords), os.cpu_count() or 1)
+    if len(passwords) < PARALLEL_HASH_MIN_ROWS or workers < 2:
+        return [make_password(password) for password in passwords]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_hasher_process) as executor:
+        return list(executor.map(make_password, passwords, chunksize=max(1, len(passwords) // (workers * 4))))
+
+
+def _text(item, name):
+    value = item.get(name)
+    return "" if value is None else str(value).strip()
+
+
+def validate_user_rows(items):
+    """Valida toda la hoja antes de escribir.
+
+    Devuelve (filas preparadas, errores por fila). Los usuarios existentes y
+    los roles se consultan una vez para todas las filas.
+    """
+    usernames = [_text(item, "username") for item in items if isinstance(item, dict)]
+    existing_usernames = set(User.objects.filter(username__in=usernames).values_list("username", flat=True))
+    groups = {group.name: group for group in Group.objects.all()}
+    username_field = User._meta.get_field("username")
+
+    prepared = []
+    errors = []
+    seen_usernames = set()
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append({"index": index, "errors": {"detail": "Cada fila debe ser un objeto."}})
+            continue
+        row_errors = {}
+        username = _text(item, "username")
+        try:
+            username_field.run_validators(username)
+            if not username:
+                raise DjangoValidationError("El usuario es obligatorio.")
+        except DjangoValidationError as exc:
+            row_errors["username"] = " ".join(exc.messages)
+        else:
+            if username in existing_usernames:
+                row_errors["username"] = "Ya existe un usuario con ese nombre."
+            elif username in seen_usernames:
+                row_errors["username"] = "Usuario repetido en la hoja."
+        seen_usernames.add(username)
+
+        password = str(item.get("password") or "")
+        if not password:
+            row_errors["password"] = "La contrasena es obligatoria para crear el usuario."
+
+        values = {name: _text(item, name) for name in TEXT_FIELDS}
+        if values["email"]:
+            try:
+                validate_email(values["email"])
+            except DjangoValidationError:
+                row_errors["email"] = "Correo invalido."
+        for name in ("first_name", "last_name"):
+            if len(values[name]) > User._meta.get_field(name).max_length:
+                row_errors[name] = "Texto demasiado largo."
+        if len(values["municipality"]) > UserProfile._meta.get_field("municipality").max_length:
+            row_errors["municipality"] = "Texto demasiado largo."
+
+        # Los respaldos de usuarios traen los roles como "groups".
+        role_names = item.get("roles", item.get("groups")) or []
+        if not isinstance(role_names, list):
+            role_names = [role_names]
+        role_names = list(dict.fromkeys(str(name) for name in role_names))
+        unknown_roles = [name for name in role_names if name not in groups]
+        if unknown_roles:
+            row_errors["roles"] = f"Roles no existen: {', '.join(unknown_roles)}."
+
+        if row_errors:
+            errors.append({"index": index, "errors": row_errors})
+            continue
+        prepared.append(
+            {
+                **values,
+                "username": username,
+                "password": password,
+                "is_active": str(item.get("is_active", True)).strip().lower() not in ("false", "0", "no"),
+                "groups": [groups[name] for name in role_names],
+            }
+        )
+    return prepared, errors
+
+
+def provision_users(prepared, password_hashes):
+    """Crea usuarios, perfiles y roles en lotes. Llamar dentro de transaction.atomic().
+
+    Los hashes se calculan antes con hash_passwords para no tener la
+    transaccion abierta mientras trabaja PBKDF2.
+    """
+    # bulk_create no dispara post_save: el perfil se crea aqui junto con los demas.
+    users = User.objects.bulk_create(
+        [
+            User(
+                username=row["username"],
+                email=row["email"],
+                first_name=row["first_name"],
+                last_name=row["last_name"],
+                is_active=row["is_active"],
+                password=password_hash,
+            )
+            for row, password_hash in zip(prepared, password_hashes)
+        ],
+        batch_size=PROVISION_BATCH_SIZE,
+    )
+
+    profiles = []
+    memberships = []
+    Membership = User.groups.through
+    for user, row in zip(users, prepared):
+        is_temporary = row["password"][0].isdigit()
+        profiles.append(
+            UserProfile(
+                user=user,
+                municipality=row["municipality"],
+                must_change_password=is_temporary,
+                temporary_password=row["password"] if is_temporary else "",
+            )
+        )
+        memberships.extend(Membership(user_id=user.pk, group_id=group.pk) for group in row["groups"])
+    UserProfile.objects.bulk_create(profiles, batch_size=PROVISION_BATCH_SIZE)
+    Membership.objects.bulk_create(memberships, batch_size=PROVISION_BATCH_SIZE)
+    return users
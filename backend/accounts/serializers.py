@@ -2,6 +2,7 @@ from django.contrib.auth.models import Group, User
 from rest_framework import serializers
 
 from accounts.models import UserProfile
+from config.listing import SparseFieldsetMixin
 
 
 class MunicipalityField(serializers.CharField):
@@ -12,7 +13,7 @@ class MunicipalityField(serializers.CharField):
             return ""
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=False)
     municipality = MunicipalityField(required=False, allow_blank=True)
     must_change_password = serializers.SerializerMethodField(read_only=True)
@@ -4,6 +4,7 @@ from urllib.parse import quote
 from django.contrib.auth.models import User
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import IntegrityError, transaction
 from django.db.utils import OperationalError
 from rest_framework import filters, status, viewsets
 from rest_framework.decorators import action
@@ -15,7 +16,9 @@ from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework_simplejwt.tokens import RefreshToken
 
 from accounts.permissions import IsAdmin
+from accounts.provisioning import hash_passwords, provision_users, validate_user_rows
 from accounts.serializers import UserSerializer
+from config.listing import OptionalPageNumberPagination, get_requested_fields
 
 
 class SISASTokenObtainPairSerializer(TokenObtainPairSerializer):
@@ -39,10 +42,19 @@ class UserViewSet(viewsets.ModelViewSet):
     filter_backends = [filters.SearchFilter]
     search_fields = ["username", "first_name", "last_name"]
 
+    pagination_class = OptionalPageNumberPagination
+
+    def get_queryset(self):
+        return super().get_queryset().select_related("profile").prefetch_related("groups")
+
     def list(self, request, *args, **kwargs):
         queryset = self.filter_queryset(self.get_queryset())
-        serializer = self.get_serializer(queryset, many=True)
+        page = self.paginate_queryset(queryset)
+        fields = get_requested_fields(request, self.get_serializer_class())
+        serializer = self.get_serializer(page if page is not None else queryset, many=True, fields=fields)
         data = list(serializer.data)
+        if page is not None:
+            return self.get_paginated_response(data)
         return Response(
             {
                 "count": len(data),
@@ -115,6 +127,42 @@ class UserViewSet(viewsets.ModelViewSet):
             }
         )
 
+    @action(detail=False, methods=["post"])
+    def bulk(self, request):
+        items = request.data if isinstance(request.data, list) else request.data.get("items")
+        if not items or not isinstance(items, list):
+            return Response(
+                {"detail": "Se requiere una lista de usuarios."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        prepared, errors = validate_user_rows(items)
+        if errors:
+            return Response(
+                {"detail": "Hay filas con errores; no se creo ningun usuario.", "errors": errors},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        password_hashes = hash_passwords([row["password"] for row in prepared])
+
+        def apply_bulk():
+            try:
+                with transaction.atomic():
+                    return provision_users(prepared, password_hashes)
+            except IntegrityError:
+                # Otro proceso creo alguno de los usuarios despues de validar.
+                return Response(
+                    {"detail": "Alguno de los usuarios ya existe. Intenta de nuevo."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+        users = self._with_retry(apply_bulk)
+        if isinstance(users, Response):
+            return users
+        return Response(
+            {"created": [{"id": user.id, "username": user.username} for user in users]},
+            status=status.HTTP_201_CREATED,
+        )
+
     def create(self, request, *args, **kwargs):
         return self._with_retry(lambda: super(UserViewSet, self).create(request, *args, **kwargs))
 
@@ -1,16 +1,188 @@
+import gzip
 import io
 import os
 import shutil
 import subprocess
+import tempfile
 import zipfile
+import zlib
 
 from django.conf import settings
-from django.http import HttpResponse
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, StreamingHttpResponse
 from django.utils import timezone
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from accounts.permissions import IsAdmin
+from medications.replication import (
+    LedgerImportError,
+    import_ledger,
+    iter_ledger_export,
+    parse_watermark,
+)
+
+DUMP_CHUNK_SIZE = 64 * 1024
+
+# formato solicitado -> (extension, content type, argumentos extra de pg_dump)
+BACKUP_FORMATS = {
+    "zip": ("zip", "application/zip", []),
+    "gzip": ("sql.gz", "application/gzip", []),
+    "custom": ("dump", "application/octet-stream", ["--format=custom"]),
+}
+
+
+class BackupError(Exception):
+    pass
+
+
+class _ChunkBuffer:
+    # Destino de escritura no posicionable: zipfile escribe aqui y el
+    # generador entrega lo acumulado en cada vuelta.
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_zip(chunks, arcname: str):
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
+        with zip_file.open(arcname, "w", force_zip64=True) as entry:
+            for chunk in chunks:
+                entry.write(chunk)
+                data = buffer.drain()
+                if data:
+                    yield data
+    yield buffer.drain()
+
+
+def stream_gzip(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def read_file_chunks(path):
+    with open(path, "rb") as source:
+        while chunk := source.read(DUMP_CHUNK_SIZE):
+            yield chunk
+
+
+def start_dump(commands):
+    """Lanza el primer comando de pg_dump que produzca salida.
+
+    Devuelve (proceso, primer bloque, archivo de stderr). Los errores de
+    conexion o permisos se detectan antes de empezar a responder y se
+    informan como BackupError.
+    """
+    last_error = ""
+    for cmd, env, cwd in commands:
+        stderr_file = tempfile.TemporaryFile()
+        try:
+            process = subprocess.Popen(
+                cmd,
+                env=env,
+                cwd=cwd,
+                stdout=subprocess.PIPE,
+                stderr=stderr_file,
+            )
+        except FileNotFoundError:
+            stderr_file.close()
+            continue
+        first_chunk = process.stdout.read(DUMP_CHUNK_SIZE)
+        if first_chunk:
+            return process, first_chunk, stderr_file
+        process.wait()
+        stderr_file.seek(0)
+        last_error = stderr_file.read().decode("utf-8", errors="ignore")[:500]
+        stderr_file.close()
+    raise BackupError(last_error)
+
+
+def iter_dump(process, first_chunk, stderr_file):
+    try:
+        yield first_chunk
+        while chunk := process.stdout.read(DUMP_CHUNK_SIZE):
+            yield chunk
+        if process.wait() != 0:
+            # Sin esto el cliente recibiria un respaldo truncado como valido;
+            # al cortar la respuesta el zip/gzip queda incompleto.
+            raise BackupError("pg_dump termino con error durante el respaldo.")
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        stderr_file.close()
+
+
+def find_pg_dump_commands(db_config, extra_args):
+    db_name = db_config.get("NAME")
+    db_user = db_config.get("USER")
+    db_pass = db_config.get("PASSWORD", "")
+    db_host = db_config.get("HOST", "127.0.0.1")
+    db_port = str(db_config.get("PORT", "5432"))
+
+    pg_dump_bin = shutil.which("pg_dump")
+    if not pg_dump_bin:
+        known_paths = [
+            "/opt/homebrew/opt/libpq/bin/pg_dump",  # macOS Apple Silicon (brew)
+            "/usr/local/opt/libpq/bin/pg_dump",     # macOS Intel (brew)
+            "/opt/local/lib/postgresql16/bin/pg_dump",  # MacPorts common
+        ]
+        for candidate in known_paths:
+            if os.path.isfile(candidate) and os.access(candidate, os.X_OK):
+                pg_dump_bin = candidate
+                break
+    if pg_dump_bin:
+        env = os.environ.copy()
+        env["PGPASSWORD"] = str(db_pass)
+        dump_cmd = [
+            pg_dump_bin,
+            "-h",
+            str(db_host),
+            "-p",
+            db_port,
+            "-U",
+            str(db_user),
+            "-d",
+            str(db_name),
+            "--no-owner",
+            "--no-privileges",
+            *extra_args,
+        ]
+        return False, [(dump_cmd, env, None)]
+
+    project_dir = str(settings.BASE_DIR.parent)
+    pg_dump_args = [
+        "pg_dump",
+        "-U",
+        str(db_user),
+        "-d",
+        str(db_name),
+        "--no-owner",
+        "--no-privileges",
+        *extra_args,
+    ]
+    return True, [
+        (["docker", "compose", "exec", "-T", "db", *pg_dump_args], None, project_dir),
+        (["docker-compose", "exec", "-T", "db", *pg_dump_args], None, project_dir),
+    ]
 
 
 class BackupDownloadView(APIView):
@@ -21,6 +193,11 @@ class BackupDownloadView(APIView):
         if not password or not request.user.check_password(password):
             return HttpResponse("Contrasena incorrecta.", status=403)
 
+        backup_format = str(request.data.get("format") or "zip").lower()
+        if backup_format not in BACKUP_FORMATS:
+            return HttpResponse("Formato de respaldo no soportado (zip, gzip o custom).", status=400)
+        extension, content_type, extra_args = BACKUP_FORMATS[backup_format]
+
         db_config = settings.DATABASES.get("default", {})
         engine = db_config.get("ENGINE", "")
         timestamp = timezone.localtime().strftime("%Y%m%d_%H%M%S")
@@ -29,127 +206,80 @@ class BackupDownloadView(APIView):
             db_name = db_config.get("NAME")
             if not db_name or not os.path.exists(db_name):
                 return HttpResponse("Base SQLite no encontrada.", status=500)
+            if backup_format == "custom":
+                return HttpResponse("El formato custom solo aplica a PostgreSQL.", status=400)
 
-            buffer = io.BytesIO()
-            with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-                backup_name = f"backup_{timestamp}.sqlite3"
-                zip_file.write(db_name, arcname=backup_name)
-
-            buffer.seek(0)
-            response = HttpResponse(buffer.getvalue(), content_type="application/zip")
-            response["Content-Disposition"] = f'attachment; filename="backup_{timestamp}.zip"'
-            return response
+            chunks = read_file_chunks(db_name)
+            if backup_format == "zip":
+                stream = stream_zip(chunks, f"backup_{timestamp}.sqlite3")
+            else:
+                stream = stream_gzip(chunks)
+                extension = "sqlite3.gz"
+            return self._streaming_response(stream, content_type, f"backup_{timestamp}.{extension}")
 
         if "postgresql" not in engine:
             return HttpResponse("Motor de base de datos no soportado para respaldo.", status=400)
 
-        db_name = db_config.get("NAME")
-        db_user = db_config.get("USER")
-        db_pass = db_config.get("PASSWORD", "")
-        db_host = db_config.get("HOST", "127.0.0.1")
-        db_port = str(db_config.get("PORT", "5432"))
-        if not db_name or not db_user:
+        if not db_config.get("NAME") or not db_config.get("USER"):
             return HttpResponse("Configuracion de base de datos incompleta.", status=500)
 
-        dump_result = None
-        pg_dump_bin = shutil.which("pg_dump")
-        if not pg_dump_bin:
-            known_paths = [
-                "/opt/homebrew/opt/libpq/bin/pg_dump",  # macOS Apple Silicon (brew)
-                "/usr/local/opt/libpq/bin/pg_dump",     # macOS Intel (brew)
-                "/opt/local/lib/postgresql16/bin/pg_dump",  # MacPorts common
-            ]
-            for candidate in known_paths:
-                if os.path.isfile(candidate) and os.access(candidate, os.X_OK):
-                    pg_dump_bin = candidate
-                    break
-        if pg_dump_bin:
-            env = os.environ.copy()
-            env["PGPASSWORD"] = str(db_pass)
-            dump_cmd = [
-                pg_dump_bin,
-                "-h",
-                str(db_host),
-                "-p",
-                db_port,
-                "-U",
-                str(db_user),
-                "-d",
-                str(db_name),
-                "--no-owner",
-                "--no-privileges",
-            ]
-            try:
-                dump_result = subprocess.run(
-                    dump_cmd,
-                    env=env,
-                    check=True,
-                    capture_output=True,
-                )
-            except subprocess.CalledProcessError as exc:
-                error_msg = exc.stderr.decode("utf-8", errors="ignore")[:500]
-                return HttpResponse(f"No se pudo generar el respaldo: {error_msg}", status=500)
-        else:
-            project_dir = str(settings.BASE_DIR.parent)
-            docker_commands = [
-                [
-                    "docker",
-                    "compose",
-                    "exec",
-                    "-T",
-                    "db",
-                    "pg_dump",
-                    "-U",
-                    str(db_user),
-                    "-d",
-                    str(db_name),
-                    "--no-owner",
-                    "--no-privileges",
-                ],
-                [
-                    "docker-compose",
-                    "exec",
-                    "-T",
-                    "db",
-                    "pg_dump",
-                    "-U",
-                    str(db_user),
-                    "-d",
-                    str(db_name),
-                    "--no-owner",
-                    "--no-privileges",
-                ],
-            ]
-            last_error = ""
-            for cmd in docker_commands:
-                try:
-                    dump_result = subprocess.run(
-                        cmd,
-                        check=True,
-                        capture_output=True,
-                        cwd=project_dir,
-                    )
-                    break
-                except FileNotFoundError:
-                    continue
-                except subprocess.CalledProcessError as exc:
-                    last_error = exc.stderr.decode("utf-8", errors="ignore")[:500]
-                    continue
-
-            if dump_result is None:
-                if last_error:
+        uses_docker, commands = find_pg_dump_commands(db_config, extra_args)
+        try:
+            process, first_chunk, stderr_file = start_dump(commands)
+        except BackupError as exc:
+            if uses_docker:
+                if str(exc):
                     return HttpResponse(
-                        f"No se pudo generar el respaldo con Docker: {last_error}",
+                        f"No se pudo generar el respaldo con Docker: {exc}",
                         status=500,
                     )
                 return HttpResponse("pg_dump no esta disponible en el servidor.", status=500)
+            return HttpResponse(f"No se pudo generar el respaldo: {exc}", status=500)
+
+        # El volcado pasa por bloques de pg_dump al compresor y a la respuesta:
+        # la memoria usada no depende del tamano de la base.
+        chunks = iter_dump(process, first_chunk, stderr_file)
+        if backup_format == "zip":
+            stream = stream_zip(chunks, f"backup_{timestamp}.sql")
+        elif backup_format == "gzip":
+            stream = stream_gzip(chunks)
+        else:
+            stream = chunks
+        return self._streaming_response(stream, content_type, f"backup_{timestamp}.{extension}")
+
+    def _streaming_response(self, stream, content_type, filename):
+        response = StreamingHttpResponse(stream, content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
 
-        buffer = io.BytesIO()
-        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-            backup_name = f"backup_{timestamp}.sql"
-            zip_file.writestr(backup_name, dump_result.stdout)
 
-        buffer.seek(0)
-        response = HttpResponse(buffer.getvalue(), content_type="application/zip")
-        response["Content-Disposition"] = f'attachment; filename="backup_{timestamp}.zip"'
+class LedgerExportView(APIView):
+    permission_classes = [IsAuthenticated, IsAdmin]
+
+    def get(self, request):
+        try:
+            since = parse_watermark(request.query_params.get("since"))
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=400)
+        timestamp = timezone.localtime().strftime("%Y%m%d_%H%M%S")
+        response = StreamingHttpResponse(
+            stream_gzip(iter_ledger_export(since)),
+            content_type="application/gzip",
+        )
+        response["Content-Disposition"] = f'attachment; filename="ledger_{timestamp}.ndjson.gz"'
         return response
+
+
+class LedgerImportView(APIView):
+    permission_classes = [IsAuthenticated, IsAdmin]
+
+    def post(self, request):
+        upload = request.FILES.get("file")
+        if not upload:
+            return Response({"detail": "file es requerido."}, status=400)
+        try:
+            with gzip.GzipFile(fileobj=upload, mode="rb") as source, transaction.atomic():
+                counts = import_ledger(io.TextIOWrapper(source, encoding="utf-8"))
+        except (OSError, EOFError, IntegrityError, LedgerImportError) as exc:
+            return Response({"detail": f"No se pudo importar el archivo: {exc}"}, status=400)
+        return Response({"imported": counts})
@@ -3,9 +3,10 @@ from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenRefreshView
 
 from accounts.views import ChangeOwnPasswordView, LogoutView, SISASTokenObtainPairView, UserViewSet
-from backup.views import BackupDownloadView
+from backup.views import BackupDownloadView, LedgerExportView, LedgerImportView
 from dashboard.views import DashboardChartsView, DashboardStatsView
 from medications.views import (
+    DispatchViewSet,
     MedicationViewSet,
     MovementViewSet,
     MunicipalityStockViewSet,
@@ -15,6 +16,9 @@ from reports.views import (
     AllMunicipalitiesMonthlyReportDownloadView,
     MunicipalityMonthlyReportDownloadView,
     MunicipalityMonthlyReportView,
+    ReportJobCreateView,
+    ReportJobDetailView,
+    ReportJobDownloadView,
 )
 
 router = DefaultRouter()
@@ -23,6 +27,7 @@ router.register(r"medications", MedicationViewSet, basename="medications")
 router.register(r"municipalities", MunicipalityViewSet, basename="municipalities")
 router.register(r"municipality-stocks", MunicipalityStockViewSet, basename="municipality-stocks")
 router.register(r"movements", MovementViewSet, basename="movements")
+router.register(r"dispatches", DispatchViewSet, basename="dispatches")
 
 urlpatterns = [
     path("reports/municipality-monthly/", MunicipalityMonthlyReportView.as_view(), name="municipality_monthly"),
@@ -71,9 +76,18 @@ urlpatterns = [
         AllMunicipalitiesMonthlyReportDownloadView.as_view(),
         name="municipality_monthly_all_alias_noslash",
     ),
+    path("reports/jobs/", ReportJobCreateView.as_view(), name="report_job_create"),
+    path("reports/jobs/<int:pk>/", ReportJobDetailView.as_view(), name="report_job_detail"),
+    path(
+        "reports/jobs/<int:pk>/download/",
+        ReportJobDownloadView.as_view(),
+        name="report_job_download",
+    ),
     path("dashboard/stats/", DashboardStatsView.as_view(), name="dashboard_stats"),
     path("dashboard/charts/", DashboardChartsView.as_view(), name="dashboard_charts"),
     path("backup/download/", BackupDownloadView.as_view(), name="backup_download"),
+    path("backup/ledger/export/", LedgerExportView.as_view(), name="ledger_export"),
+    path("backup/ledger/import/", LedgerImportView.as_view(), name="ledger_import"),
     path("auth/token/", SISASTokenObtainPairView.as_view(), name="token_obtain_pair"),
     path("auth/token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
     path("auth/logout/", LogoutView.as_view(), name="token_logout"),
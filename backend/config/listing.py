@@ -0,0 +1,41 @@
+from rest_framework.exceptions import ParseError
+from rest_framework.pagination import PageNumberPagination
+
+
+class OptionalPageNumberPagination(PageNumberPagination):
+    # Solo pagina cuando el cliente envia page o page_size; sin ellos los
+    # listados siguen devolviendo todas las filas como antes.
+    page_size_query_param = "page_size"
+    max_page_size = 500
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if (
+            self.page_query_param not in request.query_params
+            and self.page_size_query_param not in request.query_params
+        ):
+            return None
+        return super().paginate_queryset(queryset, request, view=view)
+
+
+class SparseFieldsetMixin:
+    """Permite construir el serializer con fields=[...] para omitir campos."""
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop("fields", None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+
+
+def get_requested_fields(request, serializer_class):
+    raw_value = (request.query_params.get("fields") or "").strip()
+    if not raw_value:
+        return None
+    requested = [name.strip() for name in raw_value.split(",") if name.strip()]
+    available = set(serializer_class().fields)
+    unknown = sorted(set(requested) - available)
+    if unknown:
+        raise ParseError(f"fields contiene campos desconocidos: {', '.join(unknown)}.")
+    # id se conserva siempre para que el cliente pueda referenciar la fila.
+    return ["id", *[name for name in requested if name != "id"]]
@@ -48,6 +48,7 @@ INSTALLED_APPS = [
     'rest_framework_simplejwt.token_blacklist',
     'accounts',
     'medications',
+    'reports',
 ]
 
 MIDDLEWARE = [
@@ -138,6 +139,26 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Archivos generados por el worker de reportes (run_report_worker).
+REPORTS_STORAGE_DIR = os.getenv("REPORTS_STORAGE_DIR", str(BASE_DIR / "media" / "reports"))
+# El dashboard se guarda en un cache compartido entre procesos de gunicorn
+# para que la invalidacion tras cada movimiento llegue a todos.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "dashboard": {
+        "BACKEND": os.getenv(
+            "DASHBOARD_CACHE_BACKEND", "django.core.cache.backends.filebased.FileBasedCache"
+        ),
+        "LOCATION": os.getenv("DASHBOARD_CACHE_LOCATION", str(BASE_DIR / "media" / "dashboard_cache")),
+        "TIMEOUT": int(os.getenv("DASHBOARD_CACHE_TIMEOUT", "30")),
+    },
+}
+
+# Reportes descargados directamente, direccionados por contenido (reports/cache.py).
+REPORTS_CACHE_DIR = os.getenv("REPORTS_CACHE_DIR", str(BASE_DIR / "media" / "report_cache"))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
@@ -145,7 +166,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "accounts.authentication.SISASJWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": (
         "rest_framework.permissions.IsAuthenticated",
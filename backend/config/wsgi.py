@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_wsgi_application()
+
+# Estilos y encabezados de los PDF listos antes de la primera solicitud.
+from reports.rendering import warm_pdf_kit  # noqa: E402
+
+warm_pdf_kit()
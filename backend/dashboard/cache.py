@@ -0,0 +1,41 @@
+import hashlib
+import time
+
+from django.core.cache import caches
+
+from medications.municipality_catalog import get_display_municipality_name, normalize_municipality_name
+
+DASHBOARD_CACHE_ALIAS = "dashboard"
+DASHBOARD_VERSION_KEY = "dashboard:version"
+
+
+def get_dashboard_cache():
+    return caches[DASHBOARD_CACHE_ALIAS]
+
+
+def invalidate_dashboard_cache():
+    # Cambiar la version deja huerfanas todas las respuestas guardadas, sin
+    # tener que conocer sus claves; expiran solas por TTL.
+    get_dashboard_cache().set(DASHBOARD_VERSION_KEY, time.time_ns(), None)
+
+
+def cached_dashboard_payload(view_name: str, is_admin: bool, municipality_name: str, build):
+    """Devuelve build() guardado por (vista, rol, municipio normalizado)."""
+    cache = get_dashboard_cache()
+    version = cache.get(DASHBOARD_VERSION_KEY)
+    if version is None:
+        version = time.time_ns()
+        cache.add(DASHBOARD_VERSION_KEY, version, None)
+        version = cache.get(DASHBOARD_VERSION_KEY, version)
+    role_scope = "admin" if is_admin else "municipio"
+    # Las variantes con o sin tildes, espacios o alias del catalogo comparten
+    # entrada; el hash deja la clave en ASCII sin espacios (memcached).
+    municipality_key = hashlib.sha1(
+        normalize_municipality_name(get_display_municipality_name(municipality_name)).encode("utf-8")
+    ).hexdigest()
+    key = f"dashboard:{view_name}:{version}:{role_scope}:{municipality_key}"
+    payload = cache.get(key)
+    if payload is None:
+        payload = build()
+        cache.set(key, payload)
+    return payload
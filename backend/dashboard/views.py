@@ -1,113 +1,127 @@
 from django.contrib.auth.models import User
 from django.db.models import Sum
-from django.db.models.functions import TruncMonth
 from django.utils import timezone
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from accounts.permissions import ROLE_ADMIN, user_in_group
-from medications.models import Medication, MunicipalityStock, Movement
+from dashboard.cache import cached_dashboard_payload
+from medications.models import DashboardRollup, Medication, MunicipalityStock
+from medications.municipality_catalog import resolve_municipality_ids
+
+
+def get_dashboard_scope(user):
+    municipality_name = ""
+    if hasattr(user, "profile"):
+        municipality_name = (user.profile.municipality or "").strip()
+    return user_in_group(user, ROLE_ADMIN), municipality_name
+
+
+def build_dashboard_stats(is_admin: bool, municipality_name: str):
+    if is_admin or not municipality_name:
+        materials_total = Medication.objects.count()
+    else:
+        materials_total = (
+            MunicipalityStock.objects.filter(municipality_id__in=resolve_municipality_ids(municipality_name))
+            .values("medication_id")
+            .distinct()
+            .count()
+        )
+
+    rollup_qs = DashboardRollup.objects.filter(month=timezone.localdate().replace(day=1))
+    if municipality_name:
+        rollup_qs = rollup_qs.filter(municipality_id__in=resolve_municipality_ids(municipality_name))
+    totals = rollup_qs.aggregate(ingresos=Sum("ingresos"), egresos=Sum("egresos"))
+    monthly_ingreso = totals["ingresos"] or 0
+    monthly_egreso = totals["egresos"] or 0
+
+    return {
+        "consumption_monthly": float(monthly_ingreso + monthly_egreso),
+        "monthly_ingreso": float(monthly_ingreso),
+        "monthly_egreso": float(monthly_egreso),
+        "materials_total": materials_total,
+        "service_rating": 8.5,
+    }
+
+
+def get_user_counts():
+    # Fuera de la cache: la version del dashboard no cambia con los usuarios.
+    return {
+        "users_total": User.objects.count(),
+        "users_active": User.objects.filter(is_active=True).count(),
+    }
+
+
+def build_dashboard_charts(is_admin: bool, municipality_name: str):
+    monthly_qs = DashboardRollup.objects.filter(month__isnull=False)
+    stock_qs = DashboardRollup.objects.filter(month__isnull=True, municipality__isnull=False)
+    if not is_admin and municipality_name:
+        municipality_ids = resolve_municipality_ids(municipality_name)
+        monthly_qs = monthly_qs.filter(municipality_id__in=municipality_ids)
+        stock_qs = stock_qs.filter(municipality_id__in=municipality_ids)
+
+    monthly = (
+        monthly_qs.values("month")
+        .annotate(ingreso=Sum("ingresos"), egreso=Sum("egresos"))
+        .order_by("month")
+    )
+    monthly_series = [
+        {
+            "month": item["month"].strftime("%Y-%m"),
+            "ingreso": int(item["ingreso"] or 0),
+            "egreso": int(item["egreso"] or 0),
+        }
+        for item in monthly
+        if item["ingreso"] or item["egreso"]
+    ]
+
+    distribution = (
+        stock_qs.values("municipality__name")
+        .annotate(total=Sum("stock"))
+        .order_by("municipality__name")
+    )
+    distribution_series = [
+        {"municipality": item["municipality__name"], "total": int(item["total"] or 0)}
+        for item in distribution
+    ]
+
+    trend_series = sorted(distribution_series, key=lambda x: x["total"], reverse=True)[:8]
+
+    return {
+        "monthly": monthly_series,
+        "distribution": distribution_series,
+        "trend": trend_series,
+    }
 
 
 class DashboardStatsView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        is_admin = user_in_group(request.user, ROLE_ADMIN)
-        municipality_name = ""
-        if hasattr(request.user, "profile"):
-            municipality_name = (request.user.profile.municipality or "").strip()
-
-        if is_admin or not municipality_name:
-            materials_total = Medication.objects.count()
-            users_total = User.objects.count()
-            users_active = User.objects.filter(is_active=True).count()
-            movement_qs = Movement.objects.all()
-        else:
-            materials_total = MunicipalityStock.objects.filter(
-                municipality__name__iexact=municipality_name
-            ).count()
-            users_total = User.objects.count()
-            users_active = User.objects.filter(is_active=True).count()
-            movement_qs = Movement.objects.filter(municipality__name__iexact=municipality_name)
-
-        if municipality_name:
-            movement_qs = movement_qs.filter(municipality__name__iexact=municipality_name)
-
-        now = timezone.now()
-        monthly_ingreso = (
-            movement_qs.filter(
-                type="ingreso", created_at__year=now.year, created_at__month=now.month
-            ).aggregate(total=Sum("quantity")).get("total")
-            or 0
-        )
-        monthly_egreso = (
-            movement_qs.filter(
-                type="egreso", created_at__year=now.year, created_at__month=now.month
-            ).aggregate(total=Sum("quantity")).get("total")
-            or 0
-        )
-
-        return Response(
-            {
-                "consumption_monthly": float(monthly_ingreso + monthly_egreso),
-                "monthly_ingreso": float(monthly_ingreso),
-                "monthly_egreso": float(monthly_egreso),
-                "materials_total": materials_total,
-                "users_total": users_total,
-                "users_active": users_active,
-                "service_rating": 8.5,
-            }
+        is_admin, municipality_name = get_dashboard_scope(request.user)
+        payload = cached_dashboard_payload(
+            "stats",
+            is_admin,
+            municipality_name,
+            lambda: build_dashboard_stats(is_admin, municipality_name),
         )
+        return Response({**payload, **get_user_counts()})
 
 
 class DashboardChartsView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        is_admin = user_in_group(request.user, ROLE_ADMIN)
-        municipality_name = ""
-        if hasattr(request.user, "profile"):
-            municipality_name = (request.user.profile.municipality or "").strip()
-
-        movement_qs = Movement.objects.all()
-        stock_qs = MunicipalityStock.objects.all()
-        if not is_admin and municipality_name:
-            movement_qs = movement_qs.filter(municipality__name__iexact=municipality_name)
-            stock_qs = stock_qs.filter(municipality__name__iexact=municipality_name)
-
-        monthly = (
-            movement_qs.annotate(month=TruncMonth("created_at"))
-            .values("month", "type")
-            .annotate(total=Sum("quantity"))
-            .order_by("month")
-        )
-        monthly_map = {}
-        for item in monthly:
-            key = item["month"].strftime("%Y-%m") if item["month"] else ""
-            if key not in monthly_map:
-                monthly_map[key] = {"month": key, "ingreso": 0, "egreso": 0}
-            monthly_map[key][item["type"]] = int(item["total"] or 0)
-
-        monthly_series = list(monthly_map.values())
-
-        distribution = (
-            stock_qs.values("municipality__name")
-            .annotate(total=Sum("stock"))
-            .order_by("municipality__name")
-        )
-        distribution_series = [
-            {"municipality": item["municipality__name"], "total": int(item["total"] or 0)}
-            for item in distribution
-        ]
-
-        trend_series = sorted(distribution_series, key=lambda x: x["total"], reverse=True)[:8]
-
+        is_admin, municipality_name = get_dashboard_scope(request.user)
+        if is_admin:
+            # Los administradores ven todos los municipios: comparten entrada.
+            municipality_name = ""
         return Response(
-            {
-                "monthly": monthly_series,
-                "distribution": distribution_series,
-                "trend": trend_series,
-            }
+            cached_dashboard_payload(
+                "charts",
+                is_admin,
+                municipality_name,
+                lambda: build_dashboard_charts(is_admin, municipality_name),
+            )
         )
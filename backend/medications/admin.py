@@ -1,6 +1,8 @@
 from django.contrib import admin
+from django.db import transaction
 
-from medications.models import Medication, Municipality, MunicipalityStock, Movement
+from medications.ledger import apply_movement_change, lock_medications
+from medications.models import DashboardRollup, Dispatch, Medication, MonthlyStockSnapshot, Municipality, MunicipalityStock, Movement, StockMonthClose
 
 
 @admin.register(Medication)
@@ -24,3 +26,43 @@ class MunicipalityStockAdmin(admin.ModelAdmin):
 class MovementAdmin(admin.ModelAdmin):
     list_display = ("type", "medication", "municipality", "quantity", "user", "created_at")
     search_fields = ("medication__material_name", "municipality__name", "user__username")
+
+    # Cantidades y stock se corrigen desde la API, que ajusta el stock del municipio.
+    def get_readonly_fields(self, request, obj=None):
+        if obj is None:
+            return super().get_readonly_fields(request, obj)
+        return ("type", "medication", "municipality", "quantity", "balance_after")
+
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            lock_medications([obj.medication_id])
+            apply_movement_change(previous=obj)
+            obj.delete()
+
+    def delete_queryset(self, request, queryset):
+        for obj in queryset:
+            self.delete_model(request, obj)
+
+
+@admin.register(Dispatch)
+class DispatchAdmin(admin.ModelAdmin):
+    list_display = ("number", "municipality", "user", "created_at")
+    search_fields = ("number", "municipality__name", "user__username")
+
+
+@admin.register(MonthlyStockSnapshot)
+class MonthlyStockSnapshotAdmin(admin.ModelAdmin):
+    list_display = ("month", "municipality", "medication", "closing_stock", "ingresos", "egresos")
+    list_filter = ("month",)
+    search_fields = ("municipality__name", "medication__material_name", "medication__code")
+
+
+@admin.register(StockMonthClose)
+class StockMonthCloseAdmin(admin.ModelAdmin):
+    list_display = ("month", "closed_at")
+
+
+@admin.register(DashboardRollup)
+class DashboardRollupAdmin(admin.ModelAdmin):
+    list_display = ("bucket", "municipality", "month", "ingresos", "egresos", "stock", "updated_at")
+    search_fields = ("bucket", "municipality__name")
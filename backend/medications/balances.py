@@ -0,0 +1,95 @@
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from medications.models import Movement, MunicipalityStock, StockMonthClose
+
+BACKFILL_BATCH_SIZE = 1000
+
+
+def backfill_movement_balances():
+    """Recalcula Movement.balance_after para todo el historial.
+
+    Cada par municipio/medicamento se recorre del movimiento mas reciente al
+    mas antiguo partiendo del stock actual, el mismo calculo que antes se
+    hacia en cada consulta. Las filas de stock quedan bloqueadas mientras
+    corre para que ningun movimiento nuevo quede fuera del recorrido.
+    Devuelve la cantidad de movimientos corregidos.
+    """
+    # updated_at cambia con el saldo para que la exportacion incremental lo lleve.
+    now = timezone.now()
+    with transaction.atomic():
+        current_stock = {
+            (row.municipality_id, row.medication_id): row.stock
+            for row in MunicipalityStock.objects.select_for_update().order_by("id")
+        }
+        running = {}
+        changed = []
+        updated = 0
+        rows = (
+            Movement.objects.filter(municipality__isnull=False)
+            .order_by("municipality_id", "medication_id", "-created_at", "-id")
+            .values_list("id", "municipality_id", "medication_id", "type", "quantity", "balance_after")
+        )
+        for movement_id, municipality_id, medication_id, movement_type, quantity, balance_after in rows.iterator(
+            chunk_size=5000
+        ):
+            pair = (municipality_id, medication_id)
+            if pair not in running:
+                running[pair] = current_stock.get(pair, 0)
+            if balance_after != running[pair]:
+                changed.append(Movement(id=movement_id, balance_after=running[pair], updated_at=now))
+            running[pair] -= quantity if movement_type == "ingreso" else -quantity
+            if len(changed) >= BACKFILL_BATCH_SIZE:
+                Movement.objects.bulk_update(changed, ["balance_after", "updated_at"])
+                updated += len(changed)
+                changed = []
+        if changed:
+            Movement.objects.bulk_update(changed, ["balance_after", "updated_at"])
+            updated += len(changed)
+        if updated:
+            StockMonthClose.objects.update(changed_at=now)
+    return updated
+
+
+def _signed_quantity():
+    return models.Case(
+        models.When(type="ingreso", then=models.F("quantity")),
+        default=-models.F("quantity"),
+        output_field=models.IntegerField(),
+    )
+
+
+def stock_as_of(moment):
+    """Expresion para anotar MunicipalityStock con su stock al instante moment.
+
+    Usa el balance_after del ultimo movimiento del par antes de moment; si el
+    par no tiene movimientos previos, el saldo anterior al primero posterior.
+    Solo si esos saldos faltan (historial sin backfill) se descuentan del
+    stock actual los movimientos posteriores.
+    """
+    pair_movements = Movement.objects.filter(
+        municipality_id=models.OuterRef("municipality_id"),
+        medication_id=models.OuterRef("medication_id"),
+    )
+    later = pair_movements.filter(created_at__gte=moment)
+    last_before = (
+        pair_movements.filter(created_at__lt=moment).order_by("-created_at", "-id").values("balance_after")[:1]
+    )
+    first_after = (
+        later.order_by("created_at", "id")
+        .annotate(balance_before=models.F("balance_after") - _signed_quantity())
+        .values("balance_before")[:1]
+    )
+    net_after = (
+        later.order_by()
+        .values("municipality_id")
+        .annotate(net=models.Sum(_signed_quantity()))
+        .values("net")
+    )
+    return Coalesce(
+        models.Subquery(last_before),
+        models.Subquery(first_after),
+        models.F("stock") - Coalesce(models.Subquery(net_after), 0),
+        output_field=models.IntegerField(),
+    )
@@ -0,0 +1,180 @@
+import csv
+import io
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+from django.db import transaction
+from django.utils import timezone
+
+from dashboard.cache import invalidate_dashboard_cache
+from medications.models import Medication
+
+IMPORT_BATCH_SIZE = 500
+REQUIRED_COLUMNS = ["code", "material_name", "category"]
+# physical_stock no se importa: es la suma del stock por municipio y solo
+# cambia con movimientos (ver reconcile_physical_stock).
+OPTIONAL_COLUMNS = ["monthly_demand_avg", "months_of_supply"]
+CATALOG_FORMATS = ("xlsx", "csv")
+
+
+class CatalogImportError(Exception):
+    pass
+
+
+def get_catalog_format(filename: str, requested_format: str = "") -> str:
+    catalog_format = (requested_format or filename.rsplit(".", 1)[-1]).strip().lower()
+    if catalog_format not in CATALOG_FORMATS:
+        raise CatalogImportError("Formato no soportado: usa un archivo .xlsx o .csv.")
+    return catalog_format
+
+
+def _iter_xlsx_rows(source):
+    try:
+        from openpyxl import load_workbook
+    except Exception as exc:
+        raise CatalogImportError("Instala openpyxl para importar EXCEL (pip install openpyxl).") from exc
+    # read_only recorre la hoja fila por fila sin cargar el libro completo.
+    try:
+        workbook = load_workbook(source, read_only=True, data_only=True)
+    except Exception as exc:
+        raise CatalogImportError("El archivo no es un EXCEL valido.") from exc
+    try:
+        yield from workbook.active.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def _iter_csv_rows(source):
+    text = io.TextIOWrapper(source, encoding="utf-8-sig", newline="")
+    first_line = text.readline()
+    # Excel en espanol exporta CSV separado por punto y coma.
+    delimiter = ";" if first_line.count(";") > first_line.count(",") else ","
+    yield next(csv.reader([first_line], delimiter=delimiter), [])
+    yield from csv.reader(text, delimiter=delimiter)
+
+
+def _cell_text(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        # Excel guarda los codigos numericos como 1013.0.
+        value = int(value)
+    return str(value).strip()
+
+
+def _parse_decimal(field_name: str, value: str) -> Decimal:
+    field = Medication._meta.get_field(field_name)
+    try:
+        parsed = Decimal(value.replace(",", ".")).quantize(
+            Decimal(1).scaleb(-field.decimal_places), rounding=ROUND_HALF_UP
+        )
+    except InvalidOperation as exc:
+        raise ValueError(f"{field_name} debe ser numerico.") from exc
+    if parsed < 0 or parsed >= Decimal(10) ** (field.max_digits - field.decimal_places):
+        raise ValueError(f"{field_name} fuera de rango.")
+    return parsed
+
+
+def _parse_row(columns, row):
+    values = {name: _cell_text(row[index] if index < len(row) else None) for name, index in columns.items()}
+    item = {}
+    for name in REQUIRED_COLUMNS:
+        if not values[name]:
+            raise ValueError(f"{name} es requerido.")
+        max_length = Medication._meta.get_field(name).max_length
+        if len(values[name]) > max_length:
+            raise ValueError(f"{name} supera {max_length} caracteres.")
+        item[name] = values[name]
+    for name in OPTIONAL_COLUMNS:
+        if name not in values or not values[name]:
+            continue
+        item[name] = _parse_decimal(name, values[name])
+    return item
+
+
+def read_catalog_rows(source, catalog_format: str):
+    """Lee el archivo y devuelve (filas validas por codigo, errores por linea).
+
+    Solo se usan las columnas del catalogo; id, physical_stock, created_at
+    y las demas columnas de export_insumos se ignoran.
+    """
+    rows = _iter_xlsx_rows(source) if catalog_format == "xlsx" else _iter_csv_rows(source)
+    header = [_cell_text(value).lower() for value in next(rows, None) or []]
+    missing = [name for name in REQUIRED_COLUMNS if name not in header]
+    if missing:
+        raise CatalogImportError(f"Faltan columnas: {', '.join(missing)}.")
+    columns = {
+        name: header.index(name)
+        for name in REQUIRED_COLUMNS + OPTIONAL_COLUMNS
+        if name in header
+    }
+
+    items = {}
+    errors = []
+    for line_number, row in enumerate(rows, start=2):
+        if not any(_cell_text(value) for value in row):
+            continue
+        try:
+            item = _parse_row(columns, row)
+        except ValueError as exc:
+            errors.append({"line": line_number, "detail": str(exc)})
+            continue
+        if item["code"] in items:
+            errors.append({"line": line_number, "detail": f"Codigo {item['code']} repetido en el archivo."})
+            continue
+        items[item["code"]] = item
+    return items, errors
+
+
+def diff_catalog(items):
+    """Compara con el catalogo actual en una sola consulta por codigo."""
+    existing = Medication.objects.in_bulk(list(items), field_name="code")
+    to_create = []
+    to_update = []
+    changes = []
+    for code, item in items.items():
+        medication = existing.get(code)
+        if medication is None:
+            to_create.append(Medication(**item))
+            continue
+        changed = {
+            name: [str(getattr(medication, name)), str(value)]
+            for name, value in item.items()
+            if getattr(medication, name) != value
+        }
+        if changed:
+            for name in changed:
+                setattr(medication, name, item[name])
+            to_update.append(medication)
+            changes.append({"code": code, "changes": changed})
+    return to_create, to_update, changes
+
+
+def import_catalog(source, catalog_format: str, dry_run: bool = False):
+    items, errors = read_catalog_rows(source, catalog_format)
+    to_create, to_update, changes = diff_catalog(items)
+    report = {
+        "dry_run": dry_run,
+        "rows": len(items) + len(errors),
+        "created": [medication.code for medication in to_create],
+        "updated": changes,
+        "unchanged": len(items) - len(to_create) - len(to_update),
+        "errors": errors,
+        "applied": False,
+    }
+    if dry_run or errors:
+        return report
+
+    with transaction.atomic():
+        Medication.objects.bulk_create(to_create, batch_size=IMPORT_BATCH_SIZE)
+        if to_update:
+            # bulk_update no aplica auto_now; updated_at alimenta el ETag del catalogo.
+            now = timezone.now()
+            update_fields = {"updated_at"}
+            for medication, change in zip(to_update, changes):
+                medication.updated_at = now
+                update_fields.update(change["changes"])
+            Medication.objects.bulk_update(to_update, sorted(update_fields), batch_size=IMPORT_BATCH_SIZE)
+        if to_create:
+            transaction.on_commit(invalidate_dashboard_cache)
+    report["applied"] = True
+    return report
@@ -0,0 +1,39 @@
+import hashlib
+import json
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def get_scope_version(queryset, field: str = "updated_at"):
+    # El conteo detecta altas y bajas; max(updated_at) detecta ediciones.
+    return queryset.order_by().aggregate(count=Count("pk"), updated_at=Max(field))
+
+
+def conditional_catalog_response(request, versions, build_response):
+    """Responde 304 si If-None-Match coincide; si no, llama build_response().
+
+    versions es una lista de get_scope_version(...) (u otros valores
+    serializables) que describe todo lo que lee la respuesta. La ruta con
+    su query string forma parte del ETag, asi page, fields o municipality
+    producen etiquetas distintas.
+    """
+    payload = json.dumps([request.get_full_path(), versions], sort_keys=True, default=str)
+    etag = quote_etag(hashlib.sha256(payload.encode("utf-8")).hexdigest())
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is None:
+        response = build_response()
+    else:
+        response = not_modified
+
+    timestamps = [
+        version["updated_at"]
+        for version in versions
+        if isinstance(version, dict) and version.get("updated_at")
+    ]
+    response["ETag"] = etag
+    if timestamps:
+        response["Last-Modified"] = http_date(max(timestamps).timestamp())
+    response["Cache-Control"] = "private, no-cache"
+    return response
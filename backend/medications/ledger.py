@@ -0,0 +1,206 @@
+from django.db import models
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from medications.models import (
+    DashboardRollup,
+    Dispatch,
+    Medication,
+    MunicipalityStock,
+    Movement,
+    add_movement_rollup_delta,
+)
+
+
+class MovementError(Exception):
+    def __init__(self, detail: str):
+        super().__init__(detail)
+        self.detail = detail
+
+
+def _lock_stock_rows(pairs):
+    if not pairs:
+        return {}
+    pair_filter = models.Q()
+    for municipality_id, medication_id in pairs:
+        pair_filter |= models.Q(municipality_id=municipality_id, medication_id=medication_id)
+    rows = (
+        MunicipalityStock.objects.select_for_update()
+        .filter(pair_filter)
+        .order_by("municipality_id", "medication_id")
+    )
+    return {(row.municipality_id, row.medication_id): row for row in rows}
+
+
+def lock_medications(medication_ids):
+    """Bloquea los medicamentos por id ascendente; llamar dentro de transaction.atomic().
+
+    Todo camino que escribe stock toma primero estas filas y despues las de
+    MunicipalityStock, en ese orden, para no cruzar bloqueos en PostgreSQL.
+    """
+    return {
+        medication.id: medication
+        for medication in Medication.objects.select_for_update()
+        .filter(pk__in=sorted(set(medication_ids)))
+        .order_by("id")
+    }
+
+
+def adjust_physical_stock(medication_id, delta):
+    if not delta:
+        return
+    Medication.objects.filter(pk=medication_id).update(
+        physical_stock=Greatest(models.F("physical_stock") + delta, 0),
+        updated_at=timezone.now(),
+    )
+
+
+def _lock_or_create_stock_rows(pairs):
+    stock_rows = _lock_stock_rows(pairs)
+    missing_pairs = [pair for pair in pairs if pair not in stock_rows]
+    if missing_pairs:
+        MunicipalityStock.objects.bulk_create(
+            [
+                MunicipalityStock(municipality_id=municipality_id, medication_id=medication_id, stock=0)
+                for municipality_id, medication_id in missing_pairs
+            ],
+            ignore_conflicts=True,
+        )
+        stock_rows.update(_lock_stock_rows(missing_pairs))
+    return stock_rows
+
+
+def apply_movement_change(previous=None, current=None):
+    """Lleva al stock la diferencia entre dos versiones de un movimiento.
+
+    previous es el movimiento guardado (None al crear) y current el que queda
+    (None al borrar). Asi el stock se mueve igual que los balance_after que
+    corrigen las senales y backfill_movement_balances sigue anclado al stock
+    actual. Debe llamarse dentro de transaction.atomic(); si el stock queda
+    negativo se lanza MovementError.
+    """
+    pair_deltas = {}
+    for movement, sign in ((previous, -1), (current, 1)):
+        if movement is not None and movement.municipality_id:
+            pair = (movement.municipality_id, movement.medication_id)
+            pair_deltas[pair] = pair_deltas.get(pair, 0) + sign * movement.signed_quantity
+    pair_deltas = {pair: delta for pair, delta in pair_deltas.items() if delta}
+    if not pair_deltas:
+        return
+
+    pairs = sorted(pair_deltas)
+    lock_medications([medication_id for _, medication_id in pairs])
+    stock_rows = _lock_or_create_stock_rows(pairs)
+    now = timezone.now()
+    stock_deltas = {}
+    medication_deltas = {}
+    for pair in pairs:
+        row = stock_rows[pair]
+        delta = pair_deltas[pair]
+        if row.stock + delta < 0:
+            raise MovementError("Stock insuficiente en el municipio.")
+        row.stock += delta
+        row.updated_at = now
+        stock_deltas[pair[0]] = stock_deltas.get(pair[0], 0) + delta
+        medication_deltas[pair[1]] = medication_deltas.get(pair[1], 0) + delta
+    MunicipalityStock.objects.bulk_update([stock_rows[pair] for pair in pairs], ["stock", "updated_at"])
+    for medication_id, delta in sorted(medication_deltas.items()):
+        adjust_physical_stock(medication_id, delta)
+    DashboardRollup.apply_deltas(stock_deltas=stock_deltas)
+
+
+def create_dispatch(items, user):
+    """Crea el despacho que agrupa las salidas del lote; None si no hay salidas."""
+    egresos = [item for item in items if item["type"] == "egreso"]
+    if not egresos:
+        return None
+    municipalities = {item["municipality"].id: item["municipality"] for item in egresos}
+    dispatch = Dispatch.objects.create(
+        municipality=next(iter(municipalities.values())) if len(municipalities) == 1 else None,
+        user=user,
+        notes=egresos[0]["notes"],
+    )
+    dispatch.number = f"DES-{dispatch.pk:06d}"
+    dispatch.save(update_fields=["number"])
+    return dispatch
+
+
+def apply_movements(items, user, with_dispatch=False):
+    """Aplica una lista de movimientos como un solo conjunto.
+
+    Cada item es un dict con type, medication_id, quantity, notes y
+    municipality. Debe llamarse dentro de transaction.atomic(); si algun
+    egreso deja stock negativo se lanza MovementError y no se escribe nada.
+    Con with_dispatch las salidas quedan ligadas a un Dispatch nuevo.
+    """
+    medication_ids = sorted({item["medication_id"] for item in items})
+    medications = lock_medications(medication_ids)
+    if len(medications) != len(medication_ids):
+        raise MovementError("Medicamento no existe.")
+
+    pairs = sorted({(item["municipality"].id, item["medication_id"]) for item in items})
+    stock_rows = _lock_or_create_stock_rows(pairs)
+
+    # Se recorre en el orden recibido para conservar la validacion por linea:
+    # un egreso solo puede usar el stock disponible hasta ese punto del lote.
+    # balance_after sale del mismo recorrido, con las filas de stock bloqueadas.
+    running_stock = {pair: row.stock for pair, row in stock_rows.items()}
+    medication_deltas = {medication_id: 0 for medication_id in medication_ids}
+    balances = []
+    for item in items:
+        pair = (item["municipality"].id, item["medication_id"])
+        delta = item["quantity"] if item["type"] == "ingreso" else -item["quantity"]
+        if running_stock[pair] + delta < 0:
+            raise MovementError("Stock insuficiente en el municipio.")
+        running_stock[pair] += delta
+        medication_deltas[item["medication_id"]] += delta
+        balances.append(running_stock[pair])
+
+    now = timezone.now()
+    changed_rows = []
+    stock_deltas = {}
+    for pair, row in stock_rows.items():
+        if row.stock != running_stock[pair]:
+            stock_deltas[pair[0]] = stock_deltas.get(pair[0], 0) + running_stock[pair] - row.stock
+            row.stock = running_stock[pair]
+            row.updated_at = now
+            changed_rows.append(row)
+    if changed_rows:
+        MunicipalityStock.objects.bulk_update(changed_rows, ["stock", "updated_at"])
+
+    # physical_stock es un contador: recibe el mismo delta neto que las filas
+    # por municipio, sin volver a sumar todas las ubicaciones.
+    changed_medications = []
+    for medication_id, delta in medication_deltas.items():
+        if delta:
+            medication = medications[medication_id]
+            medication.physical_stock = max(0, medication.physical_stock + delta)
+            medication.updated_at = now
+            changed_medications.append(medication)
+    if changed_medications:
+        Medication.objects.bulk_update(changed_medications, ["physical_stock", "updated_at"])
+
+    dispatch = create_dispatch(items, user) if with_dispatch else None
+    movements = Movement.objects.bulk_create(
+        [
+            Movement(
+                type=item["type"],
+                medication=medications[item["medication_id"]],
+                municipality=item["municipality"],
+                user=user,
+                quantity=item["quantity"],
+                notes=item["notes"],
+                dispatch=dispatch if item["type"] == "egreso" else None,
+                balance_after=balance_after,
+            )
+            for item, balance_after in zip(items, balances)
+        ]
+    )
+
+    # bulk_create/bulk_update no emiten senales: los totales del dashboard se
+    # actualizan aqui con los mismos deltas.
+    movement_deltas = {}
+    for movement in movements:
+        add_movement_rollup_delta(movement, 1, movement_deltas)
+    DashboardRollup.apply_deltas(movement_deltas=movement_deltas, stock_deltas=stock_deltas)
+    return movements
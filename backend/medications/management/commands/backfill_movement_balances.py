@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from medications.balances import backfill_movement_balances
+
+
+class Command(BaseCommand):
+    help = "Calcula Movement.balance_after del historial a partir del stock actual por municipio."
+
+    def handle(self, *args, **options):
+        updated = backfill_movement_balances()
+        self.stdout.write(f"{updated} movimientos actualizados.")
@@ -0,0 +1,45 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from medications.periods import previous_month_start
+from medications.snapshots import close_stock_month
+
+
+class Command(BaseCommand):
+    help = "Genera MonthlyStockSnapshot para meses cerrados (por defecto el mes anterior)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--month", help="Mes a cerrar en formato YYYY-MM.")
+        parser.add_argument(
+            "--months",
+            type=int,
+            default=1,
+            help="Cantidad de meses a cerrar hacia atras desde --month.",
+        )
+        parser.add_argument(
+            "--replace",
+            action="store_true",
+            help="Reemplaza los cierres existentes en lugar de conservarlos.",
+        )
+
+    def handle(self, *args, **options):
+        current_month = timezone.localdate().replace(day=1)
+        if options["month"]:
+            try:
+                month = datetime.strptime(options["month"], "%Y-%m").date()
+            except ValueError as exc:
+                raise CommandError("--month debe tener formato YYYY-MM.") from exc
+        else:
+            month = previous_month_start(current_month)
+
+        if month >= current_month:
+            raise CommandError("Solo se pueden cerrar meses terminados.")
+
+        for _ in range(max(1, options["months"])):
+            with transaction.atomic():
+                total = close_stock_month(month, replace=options["replace"])
+            self.stdout.write(f"{month:%Y-%m}: {total} existencias de cierre.")
+            month = previous_month_start(month)
@@ -0,0 +1,40 @@
+import gzip
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from medications.replication import iter_ledger_export, parse_watermark
+
+
+class Command(BaseCommand):
+    help = "Exporta como NDJSON comprimido los cambios del inventario desde una marca de tiempo."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--since",
+            help="Marca ISO 8601 de la exportacion anterior (linea watermark). Sin ella se exporta todo.",
+        )
+        parser.add_argument(
+            "--output",
+            help="Archivo .ndjson.gz de destino. Por defecto se escribe en la salida estandar.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            since = parse_watermark(options["since"])
+        except ValueError as exc:
+            raise CommandError(str(exc)) from exc
+
+        if options["output"]:
+            target = open(options["output"], "wb")
+        else:
+            target = sys.stdout.buffer
+        with gzip.GzipFile(fileobj=target, mode="wb") as output:
+            for line in iter_ledger_export(since):
+                if line.startswith(b'{"model":"watermark"'):
+                    next_watermark = json.loads(line)["next"]
+                    self.stderr.write(f"Siguiente --since: {next_watermark}")
+                output.write(line)
+        if options["output"]:
+            target.close()
@@ -0,0 +1,23 @@
+import gzip
+import io
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from medications.replication import LedgerImportError, import_ledger
+
+
+class Command(BaseCommand):
+    help = "Aplica una exportacion de export_ledger (.ndjson.gz); se puede repetir sin duplicar."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Archivo .ndjson.gz generado por export_ledger.")
+
+    def handle(self, *args, **options):
+        try:
+            with gzip.open(options["path"], "rb") as source, transaction.atomic():
+                counts = import_ledger(io.TextIOWrapper(source, encoding="utf-8"))
+        except (OSError, LedgerImportError) as exc:
+            raise CommandError(str(exc)) from exc
+        for model_name, total in counts.items():
+            self.stdout.write(f"{model_name}: {total} filas aplicadas.")
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from medications.catalog_import import CatalogImportError, get_catalog_format, import_catalog
+
+
+class Command(BaseCommand):
+    help = "Importa el catalogo de insumos desde EXCEL o CSV: crea los codigos nuevos y actualiza los existentes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Archivo .xlsx o .csv con columnas code, material_name y category.")
+        parser.add_argument(
+            "--format",
+            default="",
+            help="xlsx o csv. Por defecto se toma de la extension del archivo.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Solo muestra las diferencias, sin aplicarlas.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            catalog_format = get_catalog_format(options["path"], options["format"])
+            with open(options["path"], "rb") as source:
+                report = import_catalog(source, catalog_format, dry_run=options["dry_run"])
+        except (OSError, CatalogImportError) as exc:
+            raise CommandError(str(exc)) from exc
+
+        for code in report["created"]:
+            self.stdout.write(f"+ {code}")
+        for item in report["updated"]:
+            changes = ", ".join(f"{name}: {old} -> {new}" for name, (old, new) in item["changes"].items())
+            self.stdout.write(f"~ {item['code']}: {changes}")
+        for error in report["errors"]:
+            self.stderr.write(f"Linea {error['line']}: {error['detail']}")
+        self.stdout.write(
+            f"Nuevos: {len(report['created'])}, actualizados: {len(report['updated'])}, "
+            f"sin cambios: {report['unchanged']}."
+        )
+        if report["errors"]:
+            raise CommandError("El archivo tiene errores; no se aplico ningun cambio.")
+        if report["dry_run"]:
+            self.stdout.write("Simulacion: no se aplico ningun cambio.")
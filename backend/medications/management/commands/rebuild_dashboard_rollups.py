@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from medications.rollups import rebuild_dashboard_rollups
+
+
+class Command(BaseCommand):
+    help = "Recalcula los totales del dashboard (DashboardRollup) desde movimientos y stock."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            total = rebuild_dashboard_rollups()
+        self.stdout.write(f"{total} filas de resumen generadas.")
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from medications.models import Medication, MunicipalityStock
+
+
+class Command(BaseCommand):
+    help = "Compara Medication.physical_stock con la suma por municipio y corrige diferencias."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Solo muestra las diferencias, sin corregirlas.",
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options["dry_run"]
+        municipality_total = (
+            MunicipalityStock.objects.filter(medication=models.OuterRef("pk"))
+            .values("medication")
+            .annotate(total=models.Sum("stock"))
+            .values("total")
+        )
+
+        with transaction.atomic():
+            drifted = list(
+                Medication.objects.select_for_update()
+                .annotate(
+                    real_total=Coalesce(
+                        models.Subquery(municipality_total, output_field=models.IntegerField()),
+                        0,
+                    )
+                )
+                .exclude(physical_stock=models.F("real_total"))
+                .order_by("id")
+            )
+
+            for medication in drifted:
+                self.stdout.write(
+                    f"{medication.code}: contador={medication.physical_stock} real={medication.real_total}"
+                )
+
+            if drifted and not dry_run:
+                now = timezone.now()
+                for medication in drifted:
+                    medication.physical_stock = medication.real_total
+                    medication.updated_at = now
+                Medication.objects.bulk_update(drifted, ["physical_stock", "updated_at"], batch_size=500)
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS("Sin diferencias."))
+        elif dry_run:
+            self.stdout.write(self.style.WARNING(f"{len(drifted)} medicamentos con diferencias (sin cambios)."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"{len(drifted)} medicamentos corregidos."))
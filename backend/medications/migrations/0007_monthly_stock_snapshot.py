@@ -0,0 +1,30 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("medications", "0006_add_driss_solola"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MonthlyStockSnapshot",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("month", models.DateField()),
+                ("closing_stock", models.IntegerField(default=0)),
+                ("ingresos", models.PositiveIntegerField(default=0)),
+                ("egresos", models.PositiveIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("medication", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="monthly_snapshots", to="medications.medication")),
+                ("municipality", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="monthly_snapshots", to="medications.municipality")),
+            ],
+            options={
+                "ordering": ["-month"],
+                "indexes": [models.Index(fields=["month", "medication"], name="medications_month_517de8_idx")],
+                "unique_together": {("municipality", "medication", "month")},
+            },
+        ),
+    ]
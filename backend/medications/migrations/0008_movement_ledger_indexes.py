@@ -0,0 +1,23 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("medications", "0007_monthly_stock_snapshot"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="movement",
+            index=models.Index(fields=["municipality", "created_at"], name="movement_muni_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="movement",
+            index=models.Index(fields=["medication", "type", "created_at"], name="movement_med_type_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="movement",
+            index=models.Index(fields=["created_at", "type"], include=("municipality", "medication", "quantity"), name="movement_created_type_idx"),
+        ),
+    ]
@@ -0,0 +1,67 @@
+from django.db import migrations, models
+from django.db.models.functions import TruncMonth
+import django.db.models.deletion
+
+
+def build_rollups(apps, schema_editor):
+    DashboardRollup = apps.get_model("medications", "DashboardRollup")
+    Movement = apps.get_model("medications", "Movement")
+    MunicipalityStock = apps.get_model("medications", "MunicipalityStock")
+
+    rollups = []
+    for row in (
+        Movement.objects.annotate(month=TruncMonth("created_at"))
+        .values("month", "municipality_id")
+        .annotate(
+            ingresos=models.Sum("quantity", filter=models.Q(type="ingreso")),
+            egresos=models.Sum("quantity", filter=models.Q(type="egreso")),
+        )
+        .order_by()
+    ):
+        month = row["month"].date() if hasattr(row["month"], "date") else row["month"]
+        rollups.append(
+            DashboardRollup(
+                bucket=f"{month:%Y-%m}:{row['municipality_id'] or 0}",
+                municipality_id=row["municipality_id"],
+                month=month,
+                ingresos=row["ingresos"] or 0,
+                egresos=row["egresos"] or 0,
+            )
+        )
+    for row in MunicipalityStock.objects.values("municipality_id").annotate(total=models.Sum("stock")).order_by():
+        rollups.append(
+            DashboardRollup(
+                bucket=f"stock:{row['municipality_id']}",
+                municipality_id=row["municipality_id"],
+                stock=row["total"] or 0,
+            )
+        )
+    DashboardRollup.objects.bulk_create(rollups, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("medications", "0008_movement_ledger_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DashboardRollup",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("bucket", models.CharField(max_length=40, unique=True)),
+                ("month", models.DateField(blank=True, null=True)),
+                ("ingresos", models.BigIntegerField(default=0)),
+                ("egresos", models.BigIntegerField(default=0)),
+                ("stock", models.BigIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("municipality", models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name="dashboard_rollups", to="medications.municipality")),
+            ],
+            options={
+                "ordering": ["month", "bucket"],
+                "indexes": [models.Index(fields=["month", "municipality"], name="medications_month_bff305_idx")],
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("medications", "0009_dashboard_rollup"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="movement",
+            index=models.Index(fields=["medication", "created_at"], name="movement_med_created_idx"),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("medications", "0010_movement_medication_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="municipality",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("medications", "0012_dispatch"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="movement",
+            name="balance_after",
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="movement",
+            index=models.Index(fields=["municipality", "medication", "created_at"], name="movement_pair_created_idx"),
+        ),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations, models
+
+
+def mark_closed_months(apps, schema_editor):
+    # Los meses con existencias de cierre ya generadas quedan como cerrados.
+    MonthlyStockSnapshot = apps.get_model("medications", "MonthlyStockSnapshot")
+    StockMonthClose = apps.get_model("medications", "StockMonthClose")
+    months = MonthlyStockSnapshot.objects.values_list("month", flat=True).distinct()
+    StockMonthClose.objects.bulk_create(
+        [StockMonthClose(month=month) for month in months], ignore_conflicts=True
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("medications", "0013_movement_balance_after"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StockMonthClose",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("month", models.DateField(unique=True)),
+                ("closed_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "ordering": ["-month"],
+            },
+        ),
+        migrations.RunPython(mark_closed_months, migrations.RunPython.noop),
+    ]
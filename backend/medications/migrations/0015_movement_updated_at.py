@@ -0,0 +1,28 @@
+from django.db import migrations, models
+
+
+def copy_created_at(apps, schema_editor):
+    # Sin historial de ediciones se toma la fecha de alta; asi la siguiente
+    # exportacion incremental no repite todos los movimientos.
+    Movement = apps.get_model("medications", "Movement")
+    Movement.objects.update(updated_at=models.F("created_at"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("medications", "0014_stock_month_close"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="movement",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(copy_created_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="movement",
+            index=models.Index(fields=["updated_at"], name="movement_updated_idx"),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("medications", "0015_movement_updated_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="stockmonthclose",
+            name="changed_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
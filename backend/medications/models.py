@@ -1,5 +1,11 @@
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from dashboard.cache import invalidate_dashboard_cache
+from medications.municipality_catalog import invalidate_municipality_resolution_index
 
 
 class Medication(models.Model):
@@ -20,6 +26,7 @@ class Medication(models.Model):
 
 class Municipality(models.Model):
     name = models.CharField(max_length=120, unique=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ["name"]
@@ -28,6 +35,12 @@ class Municipality(models.Model):
         return self.name
 
 
+@receiver(post_save, sender=Municipality)
+@receiver(post_delete, sender=Municipality)
+def reset_municipality_resolution_index(sender, **kwargs):
+    invalidate_municipality_resolution_index()
+
+
 class MunicipalityStock(models.Model):
     municipality = models.ForeignKey(
         Municipality, on_delete=models.CASCADE, related_name="stocks"
@@ -45,6 +58,29 @@ class MunicipalityStock(models.Model):
         return f"{self.municipality} - {self.medication} ({self.stock})"
 
 
+class Dispatch(models.Model):
+    """Encabezado de un despacho: las salidas registradas juntas en un lote."""
+
+    number = models.CharField(max_length=20, unique=True, null=True, blank=True)
+    municipality = models.ForeignKey(
+        Municipality, on_delete=models.SET_NULL, null=True, blank=True, related_name="dispatches"
+    )
+    user = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, related_name="dispatches"
+    )
+    notes = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["municipality", "created_at"], name="dispatch_muni_created_idx"),
+        ]
+
+    def __str__(self):
+        return self.number or f"Despacho {self.pk}"
+
+
 class Movement(models.Model):
     TYPE_CHOICES = [
         ("ingreso", "Ingreso"),
@@ -61,10 +97,324 @@ class Movement(models.Model):
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
     quantity = models.PositiveIntegerField()
     notes = models.TextField(blank=True, default="")
+    dispatch = models.ForeignKey(
+        Dispatch, on_delete=models.SET_NULL, null=True, blank=True, related_name="movements"
+    )
+    # Stock del par municipio/medicamento despues de este movimiento. Nulo
+    # hasta correr backfill_movement_balances en el historial anterior.
+    balance_after = models.IntegerField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Marca de edicion para la exportacion incremental; tambien cambia cuando
+    # se corrige balance_after, asi la replica recibe los saldos nuevos.
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["municipality", "created_at"], name="movement_muni_created_idx"),
+            models.Index(
+                fields=["medication", "type", "created_at"],
+                name="movement_med_type_created_idx",
+            ),
+            models.Index(fields=["medication", "created_at"], name="movement_med_created_idx"),
+            # Stock a una fecha: ultimo movimiento del par antes de T.
+            models.Index(
+                fields=["municipality", "medication", "created_at"],
+                name="movement_pair_created_idx",
+            ),
+            # Cubre los reportes mensuales (GROUP BY municipio/medicamento)
+            # sin visitar la tabla en PostgreSQL.
+            models.Index(
+                fields=["created_at", "type"],
+                name="movement_created_type_idx",
+                include=["municipality", "medication", "quantity"],
+            ),
+            models.Index(fields=["updated_at"], name="movement_updated_idx"),
+        ]
 
     def __str__(self):
         return f"{self.type} - {self.medication} ({self.quantity})"
+
+    @property
+    def signed_quantity(self):
+        return self.quantity if self.type == "ingreso" else -self.quantity
+
+
+def month_start_of(value):
+    return timezone.localtime(value).date().replace(day=1)
+
+
+class MonthlyStockSnapshot(models.Model):
+    municipality = models.ForeignKey(
+        Municipality, on_delete=models.CASCADE, related_name="monthly_snapshots"
+    )
+    medication = models.ForeignKey(
+        Medication, on_delete=models.CASCADE, related_name="monthly_snapshots"
+    )
+    month = models.DateField()
+    closing_stock = models.IntegerField(default=0)
+    ingresos = models.PositiveIntegerField(default=0)
+    egresos = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["-month"]
+        unique_together = ("municipality", "medication", "month")
+        indexes = [models.Index(fields=["month", "medication"])]
+
+    def __str__(self):
+        return f"{self.municipality} - {self.medication} {self.month:%Y-%m} ({self.closing_stock})"
+
+    @classmethod
+    def apply_movement_delta(cls, municipality_id, medication_id, month, ingresos=0, egresos=0):
+        # El mes en curso se calcula al cerrarlo; aqui solo se corrigen meses
+        # ya cerrados que quedan en o despues del movimiento editado.
+        if not municipality_id or month >= timezone.localdate().replace(day=1):
+            return
+        closed_months = set(
+            StockMonthClose.objects.filter(month__gte=month).values_list("month", flat=True)
+        )
+        if not closed_months:
+            return
+        now = timezone.now()
+        StockMonthClose.objects.filter(month__in=closed_months).update(changed_at=now)
+        cls.objects.bulk_create(
+            [
+                cls(municipality_id=municipality_id, medication_id=medication_id, month=closed_month)
+                for closed_month in closed_months
+            ],
+            ignore_conflicts=True,
+        )
+        scope = cls.objects.filter(municipality_id=municipality_id, medication_id=medication_id)
+        # update() no aplica auto_now; updated_at alimenta el ETag del catalogo.
+        if month in closed_months:
+            scope.filter(month=month).update(
+                ingresos=models.F("ingresos") + ingresos,
+                egresos=models.F("egresos") + egresos,
+                updated_at=now,
+            )
+        scope.filter(month__gte=month).update(
+            closing_stock=models.F("closing_stock") + ingresos - egresos,
+            updated_at=now,
+        )
+
+
+class StockMonthClose(models.Model):
+    # Marca el mes como cerrado aunque no haya generado existencias de cierre.
+    month = models.DateField(unique=True)
+    closed_at = models.DateTimeField(auto_now_add=True)
+    # Ultima edicion de un movimiento en este mes o antes; versiona los reportes.
+    changed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-month"]
+
+    def __str__(self):
+        return f"{self.month:%Y-%m}"
+
+
+def _movement_snapshot_delta(movement, sign):
+    quantity = sign * (movement.quantity or 0)
+    MonthlyStockSnapshot.apply_movement_delta(
+        movement.municipality_id,
+        movement.medication_id,
+        month_start_of(movement.created_at),
+        ingresos=quantity if movement.type == "ingreso" else 0,
+        egresos=quantity if movement.type == "egreso" else 0,
+    )
+
+
+@receiver(pre_save, sender=Movement)
+def remember_previous_movement(sender, instance, **kwargs):
+    instance._previous_state = None
+    if instance.pk:
+        instance._previous_state = Movement.objects.filter(pk=instance.pk).first()
+
+
+@receiver(post_save, sender=Movement)
+def sync_snapshots_on_movement_save(sender, instance, created, **kwargs):
+    previous = getattr(instance, "_previous_state", None)
+    if previous is not None:
+        _movement_snapshot_delta(previous, -1)
+    _movement_snapshot_delta(instance, 1)
+
+
+@receiver(post_delete, sender=Movement)
+def sync_snapshots_on_movement_delete(sender, instance, **kwargs):
+    _movement_snapshot_delta(instance, -1)
+
+
+class DashboardRollup(models.Model):
+    """Totales precalculados para el dashboard.
+
+    Las filas con month guardan ingresos/egresos de un mes por municipio; las
+    filas sin month guardan el stock total de un municipio. bucket identifica
+    la fila para poder crearla sin carreras y sumarle deltas con F().
+    """
+
+    bucket = models.CharField(max_length=40, unique=True)
+    municipality = models.ForeignKey(
+        Municipality,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="dashboard_rollups",
+    )
+    month = models.DateField(null=True, blank=True)
+    ingresos = models.BigIntegerField(default=0)
+    egresos = models.BigIntegerField(default=0)
+    stock = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["month", "bucket"]
+        indexes = [models.Index(fields=["month", "municipality"])]
+
+    def __str__(self):
+        return self.bucket
+
+    @staticmethod
+    def month_bucket(month, municipality_id):
+        return f"{month:%Y-%m}:{municipality_id or 0}"
+
+    @staticmethod
+    def stock_bucket(municipality_id):
+        return f"stock:{municipality_id}"
+
+    @classmethod
+    def apply_deltas(cls, movement_deltas=None, stock_deltas=None):
+        """movement_deltas: {(mes, municipio_id): (ingresos, egresos)};
+        stock_deltas: {municipio_id: delta}."""
+        rows = {}
+        for (month, municipality_id), (ingresos, egresos) in (movement_deltas or {}).items():
+            if ingresos or egresos:
+                rows[cls.month_bucket(month, municipality_id)] = (
+                    cls(bucket=cls.month_bucket(month, municipality_id), municipality_id=municipality_id, month=month),
+                    {"ingresos": ingresos, "egresos": egresos},
+                )
+        for municipality_id, delta in (stock_deltas or {}).items():
+            if municipality_id:
+                rows[cls.stock_bucket(municipality_id)] = (
+                    cls(bucket=cls.stock_bucket(municipality_id), municipality_id=municipality_id),
+                    {"stock": delta},
+                )
+        if not rows:
+            return
+        cls.objects.bulk_create([row for row, _ in rows.values()], ignore_conflicts=True)
+        now = timezone.now()
+        for bucket in sorted(rows):
+            changes = {field: models.F(field) + value for field, value in rows[bucket][1].items() if value}
+            if changes:
+                cls.objects.filter(bucket=bucket).update(updated_at=now, **changes)
+        transaction.on_commit(invalidate_dashboard_cache)
+
+
+def add_movement_rollup_delta(movement, sign, deltas):
+    key = (month_start_of(movement.created_at), movement.municipality_id)
+    ingresos, egresos = deltas.get(key, (0, 0))
+    quantity = sign * (movement.quantity or 0)
+    if movement.type == "ingreso":
+        ingresos += quantity
+    else:
+        egresos += quantity
+    deltas[key] = (ingresos, egresos)
+    return deltas
+
+
+@receiver(post_save, sender=Movement)
+def sync_rollups_on_movement_save(sender, instance, created, **kwargs):
+    deltas = {}
+    previous = getattr(instance, "_previous_state", None)
+    if previous is not None:
+        add_movement_rollup_delta(previous, -1, deltas)
+    DashboardRollup.apply_deltas(movement_deltas=add_movement_rollup_delta(instance, 1, deltas))
+
+
+@receiver(post_delete, sender=Movement)
+def sync_rollups_on_movement_delete(sender, instance, **kwargs):
+    DashboardRollup.apply_deltas(movement_deltas=add_movement_rollup_delta(instance, -1, {}))
+
+
+@receiver(pre_save, sender=MunicipalityStock)
+def remember_previous_stock(sender, instance, **kwargs):
+    instance._previous_stock = None
+    if instance.pk:
+        instance._previous_stock = (
+            MunicipalityStock.objects.filter(pk=instance.pk)
+            .values_list("municipality_id", "stock")
+            .first()
+        )
+
+
+@receiver(post_save, sender=MunicipalityStock)
+def sync_rollups_on_stock_save(sender, instance, **kwargs):
+    deltas = {instance.municipality_id: instance.stock}
+    previous = getattr(instance, "_previous_stock", None)
+    if previous is not None:
+        deltas[previous[0]] = deltas.get(previous[0], 0) - previous[1]
+    DashboardRollup.apply_deltas(stock_deltas=deltas)
+
+
+@receiver(post_delete, sender=MunicipalityStock)
+def sync_rollups_on_stock_delete(sender, instance, **kwargs):
+    DashboardRollup.apply_deltas(stock_deltas={instance.municipality_id: -instance.stock})
+
+
+def _pair_movements(movement):
+    return Movement.objects.filter(
+        municipality_id=movement.municipality_id, medication_id=movement.medication_id
+    )
+
+
+def _later_movements_filter(movement):
+    return models.Q(created_at__gt=movement.created_at) | models.Q(
+        created_at=movement.created_at, id__gt=movement.id
+    )
+
+
+@receiver(post_save, sender=Movement)
+def sync_balances_on_movement_save(sender, instance, created, **kwargs):
+    # Editar un movimiento corrige el saldo de los movimientos posteriores del
+    # par; ledger.apply_movement_change mueve el stock actual con el mismo delta.
+    if not instance.municipality_id:
+        return
+    previous = getattr(instance, "_previous_state", None)
+    if previous is not None and previous.municipality_id:
+        _pair_movements(previous).filter(_later_movements_filter(previous)).exclude(pk=instance.pk).update(
+            balance_after=models.F("balance_after") - previous.signed_quantity, updated_at=timezone.now()
+        )
+    _pair_movements(instance).filter(_later_movements_filter(instance)).update(
+        balance_after=models.F("balance_after") + instance.signed_quantity, updated_at=timezone.now()
+    )
+
+    earlier = (
+        _pair_movements(instance)
+        .exclude(pk=instance.pk)
+        .exclude(_later_movements_filter(instance))
+        .order_by("-created_at", "-id")
+        .values_list("balance_after", flat=True)
+        .first()
+    )
+    if earlier is not None:
+        balance_after = earlier + instance.signed_quantity
+    elif (
+        previous is not None
+        and previous.balance_after is not None
+        and (previous.municipality_id, previous.medication_id)
+        == (instance.municipality_id, instance.medication_id)
+    ):
+        balance_after = previous.balance_after - previous.signed_quantity + instance.signed_quantity
+    else:
+        balance_after = None
+    if balance_after != instance.balance_after:
+        instance.balance_after = balance_after
+        Movement.objects.filter(pk=instance.pk).update(balance_after=balance_after, updated_at=timezone.now())
+
+
+@receiver(post_delete, sender=Movement)
+def sync_balances_on_movement_delete(sender, instance, **kwargs):
+    if not instance.municipality_id:
+        return
+    _pair_movements(instance).filter(_later_movements_filter(instance)).update(
+        balance_after=models.F("balance_after") - instance.signed_quantity, updated_at=timezone.now()
+    )
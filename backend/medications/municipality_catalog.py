@@ -1,5 +1,8 @@
+import time
 import unicodedata
 
+from django.db.models import Count, Max
+
 
 ORDERED_MUNICIPALITY_CATALOG = [
     {
@@ -129,3 +132,80 @@ for position, item in enumerate(ORDERED_MUNICIPALITY_CATALOG, start=1):
 def get_display_municipality_name(value: str) -> str:
     normalized_name = normalize_municipality_name(value)
     return DISPLAY_NAME_BY_NORMALIZED_NAME.get(normalized_name, value)
+
+
+# Indice en memoria por proceso: nombre normalizado -> ids de Municipality.
+# Las senales de Municipality lo invalidan en este proceso; para cambios
+# hechos desde otro worker se compara cada pocos segundos la version de la
+# tabla (cantidad y max(updated_at)). Un nombre que no aparece se busca una
+# vez directo en la base, sin reconstruir el indice.
+MUNICIPALITY_INDEX_CHECK_SECONDS = 5
+
+_resolution_index = None
+_resolution_index_version = None
+_resolution_index_checked_at = 0.0
+
+
+def invalidate_municipality_resolution_index():
+    global _resolution_index
+    _resolution_index = None
+
+
+def _get_index_version():
+    from medications.models import Municipality
+
+    version = Municipality.objects.aggregate(count=Count("id"), updated_at=Max("updated_at"))
+    return version["count"], version["updated_at"]
+
+
+def get_municipality_resolution_index():
+    global _resolution_index, _resolution_index_version, _resolution_index_checked_at
+    index = _resolution_index
+    now = time.monotonic()
+    if index is not None and now - _resolution_index_checked_at < MUNICIPALITY_INDEX_CHECK_SECONDS:
+        return index
+    version = _get_index_version()
+    _resolution_index_checked_at = now
+    if index is None or version != _resolution_index_version:
+        from medications.models import Municipality
+
+        by_name = {}
+        by_display_name = {}
+        for municipality_id, name in Municipality.objects.order_by("id").values_list("id", "name"):
+            by_name.setdefault(normalize_municipality_name(name), municipality_id)
+            display_key = normalize_municipality_name(get_display_municipality_name(name))
+            by_display_name.setdefault(display_key, []).append(municipality_id)
+        index = {"by_name": by_name, "by_display_name": by_display_name}
+        _resolution_index = index
+        _resolution_index_version = version
+    return index
+
+
+def _lookup_in_database(value: str) -> list[int]:
+    from medications.models import Municipality
+
+    ids = list(Municipality.objects.filter(name__iexact=value.strip()).order_by("id").values_list("id", flat=True))
+    if ids:
+        # El indice de este proceso quedo atrasado; se rehace en la siguiente consulta.
+        invalidate_municipality_resolution_index()
+    return ids
+
+
+def resolve_municipality_ids(value: str) -> list[int]:
+    display_key = normalize_municipality_name(get_display_municipality_name(value))
+    if not display_key:
+        return []
+    matches = get_municipality_resolution_index()["by_display_name"].get(display_key)
+    return list(matches) if matches else _lookup_in_database(value)
+
+
+def resolve_municipality_id(value: str):
+    name_key = normalize_municipality_name(value)
+    if not name_key:
+        return None
+    display_key = normalize_municipality_name(get_display_municipality_name(value))
+    index = get_municipality_resolution_index()
+    if name_key in index["by_name"]:
+        return index["by_name"][name_key]
+    matches = index["by_display_name"].get(display_key) or _lookup_in_database(value)
+    return matches[0] if matches else None
@@ -0,0 +1,39 @@
+from datetime import date, datetime, time as dt_time, timedelta
+
+from django.utils import timezone
+
+
+def previous_month_start(month):
+    return (month - timedelta(days=1)).replace(day=1)
+
+
+def next_month_start(month):
+    return (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def month_bounds(month):
+    # Rango semiabierto [inicio, inicio del mes siguiente) para que los
+    # filtros por mes usen los indices sobre created_at.
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.combine(month, dt_time.min), timezone=tz)
+    end = timezone.make_aware(datetime.combine(next_month_start(month), dt_time.min), timezone=tz)
+    return start, end
+
+
+def month_range_filter(year_value: int, month_value: int, field: str = "created_at"):
+    start, end = month_bounds(date(year_value, month_value, 1))
+    return {f"{field}__gte": start, f"{field}__lt": end}
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.combine(day, dt_time.min), timezone=timezone.get_current_timezone())
+
+
+def date_range_filter(date_from=None, date_to=None, field: str = "created_at"):
+    # date_to es inclusivo: se filtra hasta el inicio del dia siguiente.
+    lookup = {}
+    if date_from:
+        lookup[f"{field}__gte"] = day_start(date_from)
+    if date_to:
+        lookup[f"{field}__lt"] = day_start(date_to + timedelta(days=1))
+    return lookup
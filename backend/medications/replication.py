@@ -0,0 +1,287 @@
+import json
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import Group, User
+from django.core.management.color import no_style
+from django.db import connection
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from accounts.models import UserProfile
+from medications.models import (
+    Dispatch,
+    Medication,
+    MonthlyStockSnapshot,
+    Municipality,
+    MunicipalityStock,
+    Movement,
+    month_start_of,
+)
+from medications.rollups import rebuild_dashboard_rollups
+
+# Orden de exportacion e importacion: cada modelo despues de sus FK. Los
+# usuarios (FK de despachos y movimientos) se exportan antes que todos.
+LEDGER_MODELS = [
+    ("municipality", Municipality, "updated_at"),
+    ("medication", Medication, "updated_at"),
+    ("municipality_stock", MunicipalityStock, "updated_at"),
+    ("dispatch", Dispatch, "created_at"),
+    ("movement", Movement, "updated_at"),
+]
+LEDGER_MODEL_BY_NAME = {name: model for name, model, _ in LEDGER_MODELS}
+
+# Las filas que se guardan mientras corre la exportacion pueden tener un
+# timestamp anterior al inicio; se vuelven a incluir en la siguiente y la
+# importacion las aplica de nuevo sin efecto.
+WATERMARK_OVERLAP = timedelta(minutes=5)
+IMPORT_BATCH_SIZE = 1000
+
+USER_FIELDS = [
+    "id",
+    "username",
+    "email",
+    "first_name",
+    "last_name",
+    "password",
+    "is_active",
+    "is_staff",
+    "is_superuser",
+    "date_joined",
+    "last_login",
+]
+
+
+class LedgerImportError(Exception):
+    pass
+
+
+def parse_watermark(value):
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError("since debe ser una fecha ISO 8601, por ejemplo 2026-03-25T00:00:00+00:00.")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def _json_value(value):
+    # DjangoJSONEncoder recorta a milisegundos; aqui se conservan las fechas
+    # completas para que la replica quede identica.
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"Tipo no serializable: {type(value).__name__}")
+
+
+def _dump_line(record) -> bytes:
+    return (json.dumps(record, default=_json_value, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def iter_ledger_export(since=None):
+    """Genera lineas NDJSON (bytes) con los cambios desde la marca since.
+
+    La primera linea trae la marca a usar en la siguiente exportacion. Los
+    usuarios se exportan completos siempre: no tienen updated_at y son pocos.
+    Los movimientos se eligen por updated_at, asi que las ediciones tambien
+    viajan. Las bajas no se registran; para eso sigue el respaldo completo
+    mensual.
+    """
+    next_watermark = timezone.now()
+    yield _dump_line({"model": "watermark", "since": since, "next": next_watermark})
+
+    profiles = {
+        row["user_id"]: row
+        for row in UserProfile.objects.values(
+            "user_id", "municipality", "must_change_password", "temporary_password"
+        )
+    }
+    user_groups = {}
+    for user_id, group_name in User.groups.through.objects.values_list("user_id", "group__name"):
+        user_groups.setdefault(user_id, []).append(group_name)
+    for row in User.objects.order_by("pk").values(*USER_FIELDS).iterator(chunk_size=2000):
+        profile = profiles.get(row["id"])
+        if profile:
+            profile = {key: value for key, value in profile.items() if key != "user_id"}
+        yield _dump_line(
+            {"model": "user", **row, "groups": sorted(user_groups.get(row["id"], [])), "profile": profile}
+        )
+
+    for name, model, timestamp_field in LEDGER_MODELS:
+        queryset = model.objects.order_by("pk")
+        if since is not None:
+            queryset = queryset.filter(**{f"{timestamp_field}__gte": since - WATERMARK_OVERLAP})
+        field_names = [field.attname for field in model._meta.concrete_fields]
+        for row in queryset.values(*field_names).iterator(chunk_size=2000):
+            yield _dump_line({"model": name, **row})
+
+
+def _upsert(model, records):
+    fields = model._meta.concrete_fields
+    objects = [
+        model(**{field.attname: field.to_python(record.get(field.attname)) for field in fields})
+        for record in records
+    ]
+    model.objects.bulk_create(
+        objects,
+        batch_size=IMPORT_BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=["id"],
+        update_fields=[field.name for field in fields if not field.primary_key],
+    )
+    # bulk_create aplica auto_now/auto_now_add; se restauran las fechas del
+    # origen (created_at de los movimientos, updated_at del stock).
+    # bulk_update escribe los valores tal cual, sin pre_save.
+    timestamp_fields = [
+        field
+        for field in fields
+        if getattr(field, "auto_now", False) or getattr(field, "auto_now_add", False)
+    ]
+    if timestamp_fields:
+        for instance, record in zip(objects, records):
+            for field in timestamp_fields:
+                setattr(instance, field.attname, field.to_python(record.get(field.attname)))
+        model.objects.bulk_update(
+            objects, [field.name for field in timestamp_fields], batch_size=IMPORT_BATCH_SIZE
+        )
+
+
+def _snapshot_deltas(records):
+    """Cambio de ingresos/egresos por (municipio, medicamento, mes) de un lote.
+
+    Resta el estado anterior de las filas que ya existian y suma el nuevo,
+    igual que las senales de Movement al editar; reimportar el mismo lote
+    da cero.
+    """
+    deltas = {}
+
+    def add(municipality_id, medication_id, movement_type, quantity, created_at, sign):
+        if not municipality_id or created_at is None:
+            return
+        key = (municipality_id, medication_id, month_start_of(created_at))
+        totals = deltas.setdefault(key, [0, 0])
+        totals[0 if movement_type == "ingreso" else 1] += sign * (quantity or 0)
+
+    for row in Movement.objects.filter(id__in=[record.get("id") for record in records]).values(
+        "municipality_id", "medication_id", "type", "quantity", "created_at"
+    ):
+        add(row["municipality_id"], row["medication_id"], row["type"], row["quantity"], row["created_at"], -1)
+    created_at_field = Movement._meta.get_field("created_at")
+    for record in records:
+        add(
+            record.get("municipality_id"),
+            record.get("medication_id"),
+            record.get("type"),
+            record.get("quantity"),
+            created_at_field.to_python(record.get("created_at")),
+            1,
+        )
+    return {key: totals for key, totals in deltas.items() if any(totals)}
+
+
+def _upsert_users(records):
+    users = [
+        User(**{name: User._meta.get_field(name).to_python(record.get(name)) for name in USER_FIELDS})
+        for record in records
+    ]
+    User.objects.bulk_create(
+        users,
+        batch_size=IMPORT_BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=["id"],
+        update_fields=[name for name in USER_FIELDS if name != "id"],
+    )
+    UserProfile.objects.bulk_create(
+        [
+            UserProfile(user_id=record["id"], **record["profile"])
+            for record in records
+            if record.get("profile")
+        ],
+        batch_size=IMPORT_BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=["user"],
+        update_fields=["municipality", "must_change_password", "temporary_password"],
+    )
+
+    group_names = {name for record in records for name in record.get("groups", [])}
+    for name in group_names:
+        Group.objects.get_or_create(name=name)
+    group_ids = dict(Group.objects.filter(name__in=group_names).values_list("name", "id"))
+    user_ids = [record["id"] for record in records]
+    Membership = User.groups.through
+    Membership.objects.filter(user_id__in=user_ids).delete()
+    Membership.objects.bulk_create(
+        [
+            Membership(user_id=record["id"], group_id=group_ids[name])
+            for record in records
+            for name in record.get("groups", [])
+        ],
+        batch_size=IMPORT_BATCH_SIZE,
+    )
+
+
+def import_ledger(lines):
+    """Aplica una exportacion NDJSON. Debe llamarse dentro de transaction.atomic().
+
+    Cada fila se inserta o actualiza por id, por lo que importar dos veces
+    el mismo archivo (o exportaciones solapadas) deja el mismo resultado.
+    La carga no pasa por las senales de Movement: los cierres mensuales ya
+    generados en la replica se corrigen aqui con la diferencia de cada
+    lote. balance_after llega calculado desde el origen.
+    """
+    counts = {}
+    pending_model = None
+    pending = []
+
+    def flush():
+        if not pending:
+            return
+        if pending_model == "user":
+            _upsert_users(pending)
+        elif pending_model == "movement":
+            deltas = _snapshot_deltas(pending)
+            _upsert(Movement, pending)
+            for (municipality_id, medication_id, month), (ingresos, egresos) in deltas.items():
+                MonthlyStockSnapshot.apply_movement_delta(
+                    municipality_id, medication_id, month, ingresos=ingresos, egresos=egresos
+                )
+        else:
+            _upsert(LEDGER_MODEL_BY_NAME[pending_model], pending)
+        counts[pending_model] = counts.get(pending_model, 0) + len(pending)
+        pending.clear()
+
+    for line_number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as exc:
+            raise LedgerImportError(f"Linea {line_number}: JSON invalido.") from exc
+        model_name = record.pop("model", None)
+        if model_name == "watermark":
+            continue
+        if model_name not in LEDGER_MODEL_BY_NAME and model_name != "user":
+            raise LedgerImportError(f"Linea {line_number}: modelo desconocido {model_name!r}.")
+        if model_name != pending_model or len(pending) >= IMPORT_BATCH_SIZE:
+            flush()
+            pending_model = model_name
+        pending.append(record)
+    flush()
+
+    if connection.vendor == "postgresql":
+        # Los ids vienen del origen: se ajustan las secuencias para que las
+        # siguientes altas locales no choquen.
+        sequence_sql = connection.ops.sequence_reset_sql(
+            no_style(), [*LEDGER_MODEL_BY_NAME.values(), User, UserProfile]
+        )
+        with connection.cursor() as cursor:
+            for statement in sequence_sql:
+                cursor.execute(statement)
+
+    if counts.get("movement") or counts.get("municipality_stock"):
+        rebuild_dashboard_rollups()
+    return counts
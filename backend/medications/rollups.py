@@ -0,0 +1,53 @@
+from django.db import connection, models, transaction
+from django.db.models.functions import TruncMonth
+
+from dashboard.cache import invalidate_dashboard_cache
+from medications.models import DashboardRollup, Movement, MunicipalityStock
+
+
+def rebuild_dashboard_rollups():
+    """Recalcula DashboardRollup desde el libro de movimientos y el stock.
+
+    Debe llamarse dentro de transaction.atomic(). En PostgreSQL la tabla se
+    bloquea para que las escrituras concurrentes apliquen su delta despues
+    de la reconstruccion y no se pierdan ni se cuenten dos veces.
+    """
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute(f"LOCK TABLE {DashboardRollup._meta.db_table} IN EXCLUSIVE MODE")
+
+    rows = {}
+    for row in (
+        Movement.objects.annotate(month=TruncMonth("created_at"))
+        .values("month", "municipality_id")
+        .annotate(
+            ingresos=models.Sum("quantity", filter=models.Q(type="ingreso")),
+            egresos=models.Sum("quantity", filter=models.Q(type="egreso")),
+        )
+        .order_by()
+    ):
+        month = row["month"].date() if hasattr(row["month"], "date") else row["month"]
+        bucket = DashboardRollup.month_bucket(month, row["municipality_id"])
+        rows[bucket] = DashboardRollup(
+            bucket=bucket,
+            municipality_id=row["municipality_id"],
+            month=month,
+            ingresos=row["ingresos"] or 0,
+            egresos=row["egresos"] or 0,
+        )
+    for row in (
+        MunicipalityStock.objects.values("municipality_id")
+        .annotate(total=models.Sum("stock"))
+        .order_by()
+    ):
+        bucket = DashboardRollup.stock_bucket(row["municipality_id"])
+        rows[bucket] = DashboardRollup(
+            bucket=bucket,
+            municipality_id=row["municipality_id"],
+            stock=row["total"] or 0,
+        )
+
+    DashboardRollup.objects.all().delete()
+    DashboardRollup.objects.bulk_create(rows.values(), batch_size=1000)
+    transaction.on_commit(invalidate_dashboard_cache)
+    return len(rows)
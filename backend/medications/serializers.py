@@ -1,10 +1,11 @@
 from rest_framework import serializers
 
+from config.listing import SparseFieldsetMixin
 from medications.municipality_catalog import get_display_municipality_name
-from medications.models import Medication, Municipality, MunicipalityStock, Movement
+from medications.models import Dispatch, Medication, Municipality, MunicipalityStock, Movement
 
 
-class MedicationSerializer(serializers.ModelSerializer):
+class MedicationSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Medication
         fields = [
@@ -60,6 +61,8 @@ class MovementSerializer(serializers.ModelSerializer):
             "user_name",
             "quantity",
             "notes",
+            "dispatch",
+            "balance_after",
             "created_at",
         ]
         read_only_fields = [
@@ -68,5 +71,45 @@ class MovementSerializer(serializers.ModelSerializer):
             "municipality_name",
             "user",
             "user_name",
+            "dispatch",
+            "balance_after",
             "created_at",
         ]
+
+
+class DispatchLineSerializer(serializers.ModelSerializer):
+    medication_code = serializers.CharField(source="medication.code", read_only=True)
+    medication_name = serializers.CharField(source="medication.material_name", read_only=True)
+
+    class Meta:
+        model = Movement
+        fields = ["id", "medication", "medication_code", "medication_name", "quantity", "notes"]
+
+
+class DispatchSerializer(serializers.ModelSerializer):
+    municipality_name = serializers.CharField(source="municipality.name", read_only=True)
+    user_name = serializers.CharField(source="user.username", read_only=True)
+    line_count = serializers.IntegerField(read_only=True)
+    total_quantity = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Dispatch
+        fields = [
+            "id",
+            "number",
+            "municipality",
+            "municipality_name",
+            "user",
+            "user_name",
+            "notes",
+            "line_count",
+            "total_quantity",
+            "created_at",
+        ]
+
+
+class DispatchDetailSerializer(DispatchSerializer):
+    lines = DispatchLineSerializer(source="movements", many=True, read_only=True)
+
+    class Meta(DispatchSerializer.Meta):
+        fields = DispatchSerializer.Meta.fields + ["lines"]
@@ -0,0 +1,77 @@
+from django.db import models
+from django.utils import timezone
+
+from medications.models import MonthlyStockSnapshot, Movement, MunicipalityStock, StockMonthClose
+from medications.periods import month_bounds
+
+
+def close_stock_month(month, replace=False):
+    """Genera las existencias de cierre de un mes ya terminado.
+
+    El cierre se obtiene una sola vez restando al stock actual los movimientos
+    posteriores al mes; las correcciones posteriores las aplican las senales
+    de Movement. Las combinaciones sin stock ni movimientos no se guardan;
+    el mes queda registrado en StockMonthClose aunque no genere filas.
+    """
+    month_start, month_end = month_bounds(month)
+    current_stock = {
+        (row["municipality_id"], row["medication_id"]): row["stock"]
+        for row in MunicipalityStock.objects.exclude(stock=0).values(
+            "municipality_id", "medication_id", "stock"
+        )
+    }
+    net_after = {
+        (row["municipality_id"], row["medication_id"]): (row["ingresos"] or 0) - (row["egresos"] or 0)
+        for row in Movement.objects.filter(created_at__gte=month_end, municipality__isnull=False)
+        .values("municipality_id", "medication_id")
+        .annotate(
+            ingresos=models.Sum("quantity", filter=models.Q(type="ingreso")),
+            egresos=models.Sum("quantity", filter=models.Q(type="egreso")),
+        )
+    }
+    within = {
+        (row["municipality_id"], row["medication_id"]): (row["ingresos"] or 0, row["egresos"] or 0)
+        for row in Movement.objects.filter(
+            created_at__gte=month_start,
+            created_at__lt=month_end,
+            municipality__isnull=False,
+        )
+        .values("municipality_id", "medication_id")
+        .annotate(
+            ingresos=models.Sum("quantity", filter=models.Q(type="ingreso")),
+            egresos=models.Sum("quantity", filter=models.Q(type="egreso")),
+        )
+    }
+
+    snapshots = []
+    for pair in set(current_stock) | set(net_after) | set(within):
+        closing_stock = current_stock.get(pair, 0) - net_after.get(pair, 0)
+        ingresos, egresos = within.get(pair, (0, 0))
+        if not closing_stock and not ingresos and not egresos:
+            continue
+        snapshots.append(
+            MonthlyStockSnapshot(
+                municipality_id=pair[0],
+                medication_id=pair[1],
+                month=month,
+                closing_stock=closing_stock,
+                ingresos=ingresos,
+                egresos=egresos,
+            )
+        )
+
+    if replace:
+        MonthlyStockSnapshot.objects.filter(month=month).delete()
+    MonthlyStockSnapshot.objects.bulk_create(snapshots, batch_size=1000, ignore_conflicts=True)
+    StockMonthClose.objects.bulk_create([StockMonthClose(month=month)], ignore_conflicts=True)
+    return len(snapshots)
+
+
+def ensure_stock_snapshots(months):
+    current_month = timezone.localdate().replace(day=1)
+    closed_months = set(
+        StockMonthClose.objects.filter(month__in=months).values_list("month", flat=True)
+    )
+    for month in sorted(months):
+        if month < current_month and month not in closed_months:
+            close_stock_month(month)
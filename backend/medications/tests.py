@@ -1,3 +1,223 @@
+import io
+import re
+import zipfile
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from medications.balances import backfill_movement_balances, stock_as_of
+from medications.models import Dispatch, Medication, Municipality, MunicipalityStock, Movement, StockMonthClose
+from reports.cache import get_report_data_version
+from reports.data import build_consolidated_report_matrix, build_municipality_medication_report
+
+MOVEMENT_INDEX_PATTERN = r"movement_\w+_idx"
+
+
+class MovementIndexUsageTests(TestCase):
+    """Los reportes mensuales no deben recorrer toda la tabla de movimientos."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.municipalities = [
+            Municipality.objects.create(name=f"Municipio prueba {index}") for index in range(4)
+        ]
+        medications = Medication.objects.bulk_create(
+            [
+                Medication(category="General", code=f"P-{index:03d}", material_name=f"Insumo {index}")
+                for index in range(40)
+            ]
+        )
+        movements = Movement.objects.bulk_create(
+            [
+                Movement(
+                    type="ingreso" if index % 3 else "egreso",
+                    medication=medications[index % len(medications)],
+                    municipality=cls.municipalities[index % len(cls.municipalities)],
+                    quantity=1 + index % 7,
+                )
+                for index in range(3000)
+            ]
+        )
+        now = timezone.now()
+        for index, movement in enumerate(movements):
+            movement.created_at = now - timedelta(days=index % 365)
+        Movement.objects.bulk_update(movements, ["created_at"], batch_size=500)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def assertUsesMovementIndex(self, run):
+        """Ejecuta run() y revisa el plan de cada consulta sobre movimientos."""
+        if connection.vendor not in ("postgresql", "sqlite"):
+            self.skipTest("EXPLAIN solo se valida en PostgreSQL y SQLite.")
+        with CaptureQueriesContext(connection) as context:
+            run()
+        statements = [
+            query["sql"]
+            for query in context.captured_queries
+            if query["sql"].startswith("SELECT") and '"medications_movement"' in query["sql"]
+        ]
+        self.assertTrue(statements, "No se consultaron movimientos.")
+        for sql in statements:
+            with connection.cursor() as cursor:
+                cursor.execute(f"{connection.ops.explain_query_prefix()} {sql}")
+                plan = "\n".join(" ".join(str(value) for value in row) for row in cursor.fetchall())
+            if connection.vendor == "postgresql":
+                self.assertNotIn("Seq Scan on medications_movement", plan, plan)
+            else:
+                self.assertIsNone(re.search(r"SCAN medications_movement(?! USING)", plan), plan)
+            self.assertRegex(plan, MOVEMENT_INDEX_PATTERN, f"{sql}\n{plan}")
+
+    def test_municipality_monthly_report_uses_index(self):
+        today = timezone.localdate()
+        self.assertUsesMovementIndex(
+            lambda: build_municipality_medication_report(self.municipalities[0], today.year, today.month)
+        )
+
+    def test_consolidated_monthly_report_uses_index(self):
+        today = timezone.localdate()
+        self.assertUsesMovementIndex(lambda: build_consolidated_report_matrix(today.year, today.month))
+
+    def test_closed_month_stock_uses_index(self):
+        # Meses cerrados: la existencia sale de balance_after (stock_as_of).
+        previous_month = timezone.localdate().replace(day=1) - timedelta(days=1)
+        MunicipalityStock.objects.create(
+            municipality=self.municipalities[2], medication=Medication.objects.order_by("id").first(), stock=5
+        )
+        self.assertUsesMovementIndex(
+            lambda: build_municipality_medication_report(
+                self.municipalities[2], previous_month.year, previous_month.month
+            )
+        )
+
+    def test_medication_history_uses_index(self):
+        medication = Medication.objects.order_by("id").first()
+        client = APIClient()
+        client.force_authenticate(User.objects.create_superuser("auditor", password="x"))
+        date_from = (timezone.localdate() - timedelta(days=60)).isoformat()
+        self.assertUsesMovementIndex(
+            lambda: self.assertEqual(
+                client.get(
+                    "/api/movements/",
+                    {"medication": medication.id, "type": "ingreso", "date_from": date_from},
+                ).status_code,
+                200,
+            )
+        )
+
+
+class DispatchBatchReportTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser("despachos", password="x"))
+        self.municipality = Municipality.objects.create(name="Municipio despachos")
+        self.medication = Medication.objects.create(category="General", code="D-001", material_name="Insumo D")
+
+    def post_bulk(self, items):
+        response = self.client.post("/api/movements/bulk/", {"items": items}, format="json")
+        self.assertEqual(response.status_code, 201, response.content)
+
+    def test_same_day_batches_render_separate_slips(self):
+        line = {"medication": self.medication.id, "municipality": self.municipality.id}
+        self.post_bulk([{**line, "type": "ingreso", "quantity": 10}])
+        self.post_bulk([{**line, "type": "egreso", "quantity": 2, "notes": "primero"}])
+        self.post_bulk([{**line, "type": "egreso", "quantity": 3, "notes": "segundo"}])
+
+        today = timezone.localdate().isoformat()
+        response = self.client.post(
+            "/api/movements/dispatch-report/batch/",
+            {"date_from": today, "date_to": today, "format": "zip"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        names = zipfile.ZipFile(io.BytesIO(response.content)).namelist()
+        numbers = list(Dispatch.objects.order_by("id").values_list("number", flat=True))
+        self.assertEqual(len(names), 2)
+        for name, number in zip(names, numbers):
+            self.assertIn(number, name)
+
+
+class MovementEditStockTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser("saldos", password="x"))
+        self.municipality = Municipality.objects.create(name="Municipio saldos")
+        self.medication = Medication.objects.create(category="General", code="S-001", material_name="Insumo S")
+        line = {"medication": self.medication.id, "municipality": self.municipality.id}
+        response = self.client.post(
+            "/api/movements/bulk/",
+            {"items": [{**line, "type": "ingreso", "quantity": 10}, {**line, "type": "egreso", "quantity": 4}]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        self.movement_ids = [row["id"] for row in response.json()]
+
+    def assert_stock_matches_balances(self, expected):
+        stock = MunicipalityStock.objects.annotate(as_of=stock_as_of(timezone.now())).get(
+            municipality=self.municipality, medication=self.medication
+        )
+        self.assertEqual((stock.stock, stock.as_of), (expected, expected))
+        self.medication.refresh_from_db()
+        self.assertEqual(self.medication.physical_stock, expected)
+
+    def test_edit_moves_stock_with_balances(self):
+        response = self.client.patch(f"/api/movements/{self.movement_ids[0]}/", {"quantity": 20}, format="json")
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(
+            list(Movement.objects.order_by("id").values_list("balance_after", flat=True)), [20, 16]
+        )
+        self.assert_stock_matches_balances(16)
+
+        backfill_movement_balances()
+        self.assertEqual(
+            list(Movement.objects.order_by("id").values_list("balance_after", flat=True)), [20, 16]
+        )
+
+    def test_edit_below_zero_is_rejected(self):
+        response = self.client.patch(f"/api/movements/{self.movement_ids[0]}/", {"quantity": 2}, format="json")
+        self.assertEqual(response.status_code, 400, response.content)
+        self.assert_stock_matches_balances(6)
+
+    def test_delete_moves_stock_with_balances(self):
+        response = self.client.delete(f"/api/movements/{self.movement_ids[1]}/")
+        self.assertEqual(response.status_code, 204, response.content)
+        self.assert_stock_matches_balances(10)
+
+
+class ReportDataVersionTests(TestCase):
+    def setUp(self):
+        self.municipality = Municipality.objects.create(name="Municipio version")
+        self.medication = Medication.objects.create(category="General", code="V-001", material_name="Insumo V")
+        self.month = (timezone.localdate().replace(day=1) - timedelta(days=1)).replace(day=1)
+        self.movement = Movement.objects.create(
+            type="ingreso", medication=self.medication, municipality=self.municipality, quantity=10
+        )
+        Movement.objects.filter(pk=self.movement.pk).update(created_at=timezone.now() - timedelta(days=70))
+        StockMonthClose.objects.create(month=self.month)
+
+    def version(self):
+        return get_report_data_version(self.month.year, self.month.month, municipality_id=self.municipality.id)
+
+    def test_closed_month_version_does_not_read_history(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.version()
+        history_queries = [
+            query["sql"] for query in queries.captured_queries
+            if "medications_movement" in query["sql"] and "created_at\" <" in query["sql"]
+            and "created_at\" >=" not in query["sql"]
+        ]
+        self.assertEqual(history_queries, [])
+
+    def test_back_dated_edit_changes_closed_month_version(self):
+        before = self.version()
+        Movement.objects.create(type="ingreso", medication=self.medication, municipality=self.municipality, quantity=5)
+        self.assertEqual(self.version(), before)
 
-# Create your tests here.
+        movement = Movement.objects.get(pk=self.movement.pk)
+        movement.quantity = 12
+        movement.save()
+        self.assertNotEqual(self.version(), before)
@@ -1,25 +1,57 @@
 import time
-import unicodedata
-from datetime import datetime, time as dt_time, timedelta
+from datetime import datetime, timedelta
+from io import BytesIO
 from decimal import Decimal, ROUND_HALF_UP
 
 from django.db import models, transaction
 from django.db.utils import OperationalError
 from django.utils import timezone
-from rest_framework import filters, viewsets
+from rest_framework import filters, serializers, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ParseError
 from rest_framework.response import Response
 from rest_framework import status
 from django.http import HttpResponse
 
 from accounts.permissions import MedicationAccessPermission, ROLE_ADMIN, user_in_group
+from config.listing import OptionalPageNumberPagination, get_requested_fields
 from medications.municipality_catalog import (
     ORDERED_MUNICIPALITY_CATALOG,
-    get_display_municipality_name,
-    normalize_municipality_name,
+    resolve_municipality_id,
+    resolve_municipality_ids,
+)
+from medications.balances import stock_as_of
+from medications.catalog_import import CatalogImportError, get_catalog_format, import_catalog
+from medications.conditional import conditional_catalog_response, get_scope_version
+from medications.ledger import (
+    MovementError,
+    adjust_physical_stock,
+    apply_movement_change,
+    apply_movements,
+    lock_medications,
+)
+from medications.models import (
+    Dispatch,
+    Medication,
+    MonthlyStockSnapshot,
+    Municipality,
+    MunicipalityStock,
+    Movement,
+)
+from medications.pagination import MovementCursorPagination
+from medications.periods import date_range_filter, day_start, previous_month_start
+from medications.snapshots import ensure_stock_snapshots
+from reports.data import build_dispatch_slip, group_dispatch_movements_by_day
+from reports.rendering import (
+    PDF_CONTENT_TYPE,
+    ZIP_CONTENT_TYPE,
+    ReportDependencyError,
+    render_dispatch_pdf,
+    render_dispatch_zip,
 )
-from medications.models import Medication, Municipality, MunicipalityStock, Movement
 from medications.serializers import (
+    DispatchDetailSerializer,
+    DispatchSerializer,
     MedicationSerializer,
     MunicipalitySerializer,
     MunicipalityStockSerializer,
@@ -29,6 +61,20 @@ from medications.serializers import (
 GLOBAL_MUNICIPALITY_NAME = "CONSOLIDADO GENERAL"
 
 
+def get_profile_municipality_name(user) -> str:
+    if hasattr(user, "profile"):
+        return (user.profile.municipality or "").strip()
+    return ""
+
+
+def get_or_create_municipality_by_name(municipality_name: str):
+    municipality_id = resolve_municipality_id(municipality_name)
+    municipality = Municipality.objects.filter(pk=municipality_id).first() if municipality_id else None
+    if not municipality:
+        municipality, _ = Municipality.objects.get_or_create(name=municipality_name)
+    return municipality
+
+
 class MedicationViewSet(viewsets.ModelViewSet):
     queryset = Medication.objects.all().order_by("material_name")
     serializer_class = MedicationSerializer
@@ -36,12 +82,39 @@ class MedicationViewSet(viewsets.ModelViewSet):
     filter_backends = [filters.SearchFilter]
     search_fields = ["code", "material_name"]
 
+    pagination_class = OptionalPageNumberPagination
+
     def list(self, request, *args, **kwargs):
-        queryset = self.filter_queryset(self.get_queryset())
         municipality_id = self._get_requested_municipality_id()
-        serializer = self.get_serializer(queryset, many=True)
+        stock_queryset = MunicipalityStock.objects.all()
+        if municipality_id:
+            stock_queryset = stock_queryset.filter(municipality_id=municipality_id)
+        current_month_start = timezone.localdate().replace(day=1)
+        previous_month = previous_month_start(current_month_start)
+        versions = [
+            get_scope_version(Medication.objects.all()),
+            get_scope_version(stock_queryset),
+            get_scope_version(
+                MonthlyStockSnapshot.objects.filter(
+                    month__in=[previous_month, previous_month_start(previous_month)]
+                )
+            ),
+            current_month_start,
+        ]
+        return conditional_catalog_response(request, versions, lambda: self._list_response(request))
+
+    def _list_response(self, request):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        fields = get_requested_fields(request, self.get_serializer_class())
+        serializer = self.get_serializer(page if page is not None else queryset, many=True, fields=fields)
         data = list(serializer.data)
-        self._inject_two_month_average(data, municipality_id=municipality_id)
+        if fields is None or {"monthly_demand_avg", "months_of_supply"} & set(fields):
+            self._inject_two_month_average(
+                data, municipality_id=self._get_requested_municipality_id()
+            )
+        if page is not None:
+            return self.get_paginated_response(data)
         return Response(
             {
                 "count": len(data),
@@ -79,10 +152,17 @@ class MedicationViewSet(viewsets.ModelViewSet):
             return
 
         stock_queryset = MunicipalityStock.objects.filter(medication_id__in=medication_ids)
-        movement_queryset = Movement.objects.filter(medication_id__in=medication_ids)
+        current_month_start = timezone.localdate().replace(day=1)
+        previous_month = previous_month_start(current_month_start)
+        two_months_back = previous_month_start(previous_month)
+        ensure_stock_snapshots([previous_month, two_months_back])
+        snapshot_queryset = MonthlyStockSnapshot.objects.filter(
+            medication_id__in=medication_ids,
+            month__in=[previous_month, two_months_back],
+        )
         if municipality_id:
             stock_queryset = stock_queryset.filter(municipality_id=municipality_id)
-            movement_queryset = movement_queryset.filter(municipality_id=municipality_id)
+            snapshot_queryset = snapshot_queryset.filter(municipality_id=municipality_id)
 
         current_stock_map = {
             row["medication_id"]: row["total"] or 0
@@ -90,51 +170,12 @@ class MedicationViewSet(viewsets.ModelViewSet):
             .values("medication_id")
             .annotate(total=models.Sum("stock"))
         }
-
-        now_local = timezone.localtime()
-        current_month_start = now_local.date().replace(day=1)
-        previous_month_end = current_month_start - timedelta(days=1)
-        two_months_back_end = previous_month_end.replace(day=1) - timedelta(days=1)
-
-        tz = timezone.get_current_timezone()
-        cutoff_prev = timezone.make_aware(
-            datetime.combine(previous_month_end, dt_time.max),
-            timezone=tz,
-        )
-        cutoff_two_back = timezone.make_aware(
-            datetime.combine(two_months_back_end, dt_time.max),
-            timezone=tz,
-        )
-
-        movement_rows = (
-            movement_queryset.values("medication_id").annotate(
-                in_after_prev=models.Sum(
-                    "quantity",
-                    filter=models.Q(type="ingreso", created_at__gt=cutoff_prev),
-                ),
-                out_after_prev=models.Sum(
-                    "quantity",
-                    filter=models.Q(type="egreso", created_at__gt=cutoff_prev),
-                ),
-                in_after_two_back=models.Sum(
-                    "quantity",
-                    filter=models.Q(type="ingreso", created_at__gt=cutoff_two_back),
-                ),
-                out_after_two_back=models.Sum(
-                    "quantity",
-                    filter=models.Q(type="egreso", created_at__gt=cutoff_two_back),
-                ),
-            )
-        )
-
-        movement_map = {
-            row["medication_id"]: {
-                "in_after_prev": row["in_after_prev"] or 0,
-                "out_after_prev": row["out_after_prev"] or 0,
-                "in_after_two_back": row["in_after_two_back"] or 0,
-                "out_after_two_back": row["out_after_two_back"] or 0,
-            }
-            for row in movement_rows
+        closing_stock_map = {
+            (row["medication_id"], row["month"]): row["total"] or 0
+            for row in snapshot_queryset
+            .values("medication_id", "month")
+            .annotate(total=models.Sum("closing_stock"))
+            .order_by()
         }
 
         for item in items:
@@ -143,24 +184,8 @@ class MedicationViewSet(viewsets.ModelViewSet):
                 continue
 
             current_stock = current_stock_map.get(medication_id, 0)
-            movement = movement_map.get(
-                medication_id,
-                {
-                    "in_after_prev": 0,
-                    "out_after_prev": 0,
-                    "in_after_two_back": 0,
-                    "out_after_two_back": 0,
-                },
-            )
-
-            stock_prev_month = current_stock - (
-                movement["in_after_prev"] - movement["out_after_prev"]
-            )
-            stock_two_months_back = current_stock - (
-                movement["in_after_two_back"] - movement["out_after_two_back"]
-            )
-            stock_prev_month = max(0, stock_prev_month)
-            stock_two_months_back = max(0, stock_two_months_back)
+            stock_prev_month = max(0, closing_stock_map.get((medication_id, previous_month), 0))
+            stock_two_months_back = max(0, closing_stock_map.get((medication_id, two_months_back), 0))
 
             average = (
                 (Decimal(stock_prev_month) + Decimal(stock_two_months_back)) / Decimal("2")
@@ -172,8 +197,26 @@ class MedicationViewSet(viewsets.ModelViewSet):
             else:
                 months_available = 0
 
-            item["monthly_demand_avg"] = monthly_avg
-            item["months_of_supply"] = int(months_available)
+            # Solo se reemplazan los campos que el serializer incluyo (fields=).
+            if "monthly_demand_avg" in item:
+                item["monthly_demand_avg"] = monthly_avg
+            if "months_of_supply" in item:
+                item["months_of_supply"] = int(months_available)
+
+    @action(detail=False, methods=["post"], url_path="import")
+    def import_catalog(self, request):
+        upload = request.FILES.get("file")
+        if not upload:
+            return Response({"detail": "file es requerido."}, status=status.HTTP_400_BAD_REQUEST)
+        dry_run = str(request.data.get("dry_run", "")).strip().lower() in ("1", "true")
+        try:
+            catalog_format = get_catalog_format(upload.name, str(request.data.get("format", "")))
+            report = import_catalog(upload, catalog_format, dry_run=dry_run)
+        except CatalogImportError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        if report["errors"]:
+            return Response(report, status=status.HTTP_400_BAD_REQUEST)
+        return Response(report)
 
 class MunicipalityViewSet(viewsets.ModelViewSet):
     queryset = Municipality.objects.all()
@@ -199,6 +242,13 @@ class MunicipalityViewSet(viewsets.ModelViewSet):
         ).order_by("is_global", "catalog_order", "name")
 
     def list(self, request, *args, **kwargs):
+        return conditional_catalog_response(
+            request,
+            [get_scope_version(Municipality.objects.all())],
+            lambda: self._list_response(request),
+        )
+
+    def _list_response(self, request):
         queryset = self.filter_queryset(self.get_queryset())
         seen_names = set()
         unique_items = []
@@ -240,28 +290,54 @@ class MunicipalityViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=["get"])
     def stocks(self, request, pk=None):
         municipality = self.get_object()
-        medication_ids = set(Medication.objects.values_list("id", flat=True))
-        existing_ids = set(
-            MunicipalityStock.objects.filter(municipality=municipality).values_list(
-                "medication_id", flat=True
-            )
+        versions = [
+            get_scope_version(Municipality.objects.filter(pk=municipality.pk)),
+            get_scope_version(Medication.objects.all()),
+            get_scope_version(MunicipalityStock.objects.filter(municipality=municipality)),
+        ]
+        return conditional_catalog_response(
+            request, versions, lambda: self._stocks_response(municipality)
         )
-        missing_ids = medication_ids - existing_ids
-        if missing_ids:
-            MunicipalityStock.objects.bulk_create(
-                [
-                    MunicipalityStock(
-                        municipality=municipality, medication_id=med_id, stock=0
-                    )
-                    for med_id in missing_ids
-                ]
-            )
 
-        queryset = MunicipalityStock.objects.filter(municipality=municipality).select_related(
-            "municipality", "medication"
+    def _stocks_response(self, municipality):
+        # Un solo LEFT JOIN de Medication contra el stock del municipio: los
+        # medicamentos sin fila se devuelven con stock 0 sin crearla. La fila
+        # real la crea el primer movimiento que la toca (ledger.apply_movements).
+        rows = (
+            Medication.objects.annotate(
+                municipality_stock=models.FilteredRelation(
+                    "municipality_stocks",
+                    condition=models.Q(municipality_stocks__municipality=municipality),
+                )
+            )
+            .values(
+                "id",
+                "material_name",
+                "municipality_stock__id",
+                "municipality_stock__stock",
+                "municipality_stock__updated_at",
+            )
+            .order_by("material_name", "id")
+        )
+        updated_at_field = serializers.DateTimeField()
+        return Response(
+            [
+                {
+                    "id": row["municipality_stock__id"],
+                    "municipality": municipality.id,
+                    "municipality_name": municipality.name,
+                    "medication": row["id"],
+                    "medication_name": row["material_name"],
+                    "stock": row["municipality_stock__stock"] or 0,
+                    "updated_at": (
+                        updated_at_field.to_representation(row["municipality_stock__updated_at"])
+                        if row["municipality_stock__updated_at"]
+                        else None
+                    ),
+                }
+                for row in rows
+            ]
         )
-        serializer = MunicipalityStockSerializer(queryset, many=True)
-        return Response(serializer.data)
 
 
 class MunicipalityStockViewSet(viewsets.ModelViewSet):
@@ -278,6 +354,42 @@ class MunicipalityStockViewSet(viewsets.ModelViewSet):
         )
         return Response(list(data))
 
+    @action(detail=False, methods=["get"], url_path="as-of")
+    def as_of(self, request):
+        raw_date = request.query_params.get("date")
+        if not raw_date:
+            return Response({"detail": "date es requerido."}, status=status.HTTP_400_BAD_REQUEST)
+        day = parse_filter_date(raw_date, "date")
+        queryset = MunicipalityStock.objects.select_related("municipality", "medication").order_by(
+            "municipality__name", "medication__material_name"
+        )
+        if request.query_params.get("municipality"):
+            queryset = queryset.filter(
+                municipality_id=parse_filter_id(request.query_params["municipality"], "municipality")
+            )
+
+        # Existencia al cierre del dia; hoy y fechas futuras usan el stock actual.
+        if day < timezone.localdate():
+            queryset = queryset.annotate(stock_as_of=stock_as_of(day_start(day + timedelta(days=1))))
+        else:
+            queryset = queryset.annotate(stock_as_of=models.F("stock"))
+        return Response(
+            {
+                "date": day,
+                "results": [
+                    {
+                        "municipality": row.municipality_id,
+                        "municipality_name": row.municipality.name,
+                        "medication": row.medication_id,
+                        "medication_code": row.medication.code,
+                        "medication_name": row.medication.material_name,
+                        "stock": row.stock_as_of,
+                    }
+                    for row in queryset
+                ],
+            }
+        )
+
     def create(self, request, *args, **kwargs):
         municipality_id = request.data.get("municipality")
         medication_id = request.data.get("medication")
@@ -323,11 +435,19 @@ class MunicipalityStockViewSet(viewsets.ModelViewSet):
 
         def apply_stock():
             with transaction.atomic():
+                lock_medications([medication.id])
+                previous = (
+                    MunicipalityStock.objects.select_for_update()
+                    .filter(municipality=municipality, medication=medication)
+                    .values_list("stock", flat=True)
+                    .first()
+                )
                 instance, created = MunicipalityStock.objects.update_or_create(
                     municipality=municipality,
                     medication=medication,
                     defaults={"stock": max(0, stock)},
                 )
+                adjust_physical_stock(medication.id, instance.stock - (previous or 0))
             return instance, created
 
         result = self._with_retry(apply_stock)
@@ -339,6 +459,27 @@ class MunicipalityStockViewSet(viewsets.ModelViewSet):
         status_code = status.HTTP_201_CREATED if created else status.HTTP_200_OK
         return Response(output.data, status=status_code)
 
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            medication_ids = [serializer.instance.medication_id]
+            if serializer.validated_data.get("medication"):
+                medication_ids.append(serializer.validated_data["medication"].id)
+            lock_medications(medication_ids)
+            previous = MunicipalityStock.objects.select_for_update().get(pk=serializer.instance.pk)
+            instance = serializer.save()
+            if previous.medication_id != instance.medication_id:
+                adjust_physical_stock(previous.medication_id, -previous.stock)
+                adjust_physical_stock(instance.medication_id, instance.stock)
+            else:
+                adjust_physical_stock(instance.medication_id, instance.stock - previous.stock)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            lock_medications([instance.medication_id])
+            instance = MunicipalityStock.objects.select_for_update().get(pk=instance.pk)
+            adjust_physical_stock(instance.medication_id, -instance.stock)
+            instance.delete()
+
     def _with_retry(self, fn, retries=5, base_delay=0.1):
         last_error = None
         for attempt in range(retries):
@@ -355,37 +496,108 @@ class MunicipalityStockViewSet(viewsets.ModelViewSet):
         )
 
 
+def parse_filter_date(value, name):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError as exc:
+        raise ParseError(f"{name} debe tener formato YYYY-MM-DD.") from exc
+
+
+def parse_filter_id(value, name):
+    if not str(value).isdigit():
+        raise ParseError(f"{name} debe ser un entero.")
+    return int(value)
+
+
+def scope_to_user_municipality(queryset, user):
+    if user_in_group(user, ROLE_ADMIN):
+        return queryset
+
+    municipality_name = get_profile_municipality_name(user)
+    if not municipality_name:
+        return queryset.none()
+
+    matching_ids = resolve_municipality_ids(municipality_name)
+    if not matching_ids:
+        return queryset.none()
+
+    return queryset.filter(municipality_id__in=matching_ids)
+
+
 class MovementViewSet(viewsets.ModelViewSet):
     queryset = Movement.objects.select_related("medication", "municipality", "user").all()
     serializer_class = MovementSerializer
     permission_classes = [MedicationAccessPermission]
+    pagination_class = MovementCursorPagination
 
-    def get_queryset(self):
-        queryset = super().get_queryset().order_by("-created_at", "-id")
-        if user_in_group(self.request.user, ROLE_ADMIN):
+    def filter_queryset(self, queryset):
+        # Filtros del historial; cada uno coincide con un indice de Movement.
+        queryset = super().filter_queryset(queryset)
+        if self.action != "list":
             return queryset
+        params = self.request.query_params
+        date_from = params.get("date_from")
+        date_to = params.get("date_to")
+        queryset = queryset.filter(
+            **date_range_filter(
+                parse_filter_date(date_from, "date_from") if date_from else None,
+                parse_filter_date(date_to, "date_to") if date_to else None,
+            )
+        )
+        movement_type = params.get("type")
+        if movement_type:
+            if movement_type not in {"ingreso", "egreso"}:
+                raise ParseError("type debe ser ingreso o egreso.")
+            queryset = queryset.filter(type=movement_type)
+        if params.get("medication"):
+            queryset = queryset.filter(medication_id=parse_filter_id(params["medication"], "medication"))
+        if params.get("municipality"):
+            queryset = queryset.filter(
+                municipality_id=parse_filter_id(params["municipality"], "municipality")
+            )
+        return queryset
 
-        municipality_name = ""
-        if hasattr(self.request.user, "profile"):
-            municipality_name = (self.request.user.profile.municipality or "").strip()
-
-        if not municipality_name:
-            return queryset.none()
+    def get_queryset(self):
+        return scope_to_user_municipality(super().get_queryset().order_by("-created_at", "-id"), self.request.user)
 
-        normalized_target = normalize_municipality_name(
-            get_display_municipality_name(municipality_name)
-        )
-        matching_ids = []
-        for municipality in Municipality.objects.all():
-            if normalize_municipality_name(
-                get_display_municipality_name(municipality.name)
-            ) == normalized_target:
-                matching_ids.append(municipality.id)
+    def update(self, request, *args, **kwargs):
+        try:
+            return super().update(request, *args, **kwargs)
+        except MovementError as exc:
+            return Response({"detail": exc.detail}, status=status.HTTP_400_BAD_REQUEST)
 
-        if not matching_ids:
-            return queryset.none()
+    def destroy(self, request, *args, **kwargs):
+        try:
+            return super().destroy(request, *args, **kwargs)
+        except MovementError as exc:
+            return Response({"detail": exc.detail}, status=status.HTTP_400_BAD_REQUEST)
+
+    def perform_update(self, serializer):
+        # El stock recibe la misma diferencia que los saldos posteriores.
+        data = serializer.validated_data
+        with transaction.atomic():
+            medication_ids = [serializer.instance.medication_id]
+            if data.get("medication"):
+                medication_ids.append(data["medication"].id)
+            lock_medications(medication_ids)
+            previous = Movement.objects.select_for_update().get(pk=serializer.instance.pk)
+            municipality = data.get("municipality", previous.municipality)
+            current = Movement(
+                pk=previous.pk,
+                type=data.get("type", previous.type),
+                medication=data.get("medication", previous.medication),
+                municipality=municipality,
+                quantity=data.get("quantity", previous.quantity),
+            )
+            apply_movement_change(previous, current)
+            serializer.save()
 
-        return queryset.filter(municipality_id__in=matching_ids)
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            lock_medications([instance.medication_id])
+            instance = Movement.objects.select_for_update().get(pk=instance.pk)
+            apply_movement_change(previous=instance)
+            instance.delete()
 
     @action(detail=False, methods=["post"], url_path="dispatch-report")
     def dispatch_report(self, request):
@@ -393,114 +605,21 @@ class MovementViewSet(viewsets.ModelViewSet):
         if not ids or not isinstance(ids, list):
             return Response({"detail": "ids es requerido."}, status=status.HTTP_400_BAD_REQUEST)
 
-        movements = (
+        movements = list(
             Movement.objects.filter(id__in=ids)
-            .select_related("medication", "municipality", "user")
+            .select_related("medication", "municipality", "user", "dispatch")
             .order_by("id")
         )
-        if not movements.exists():
+        if not movements:
             return Response({"detail": "Movimientos no encontrados."}, status=status.HTTP_404_NOT_FOUND)
 
-        try:
-            from io import BytesIO
-            from reportlab.lib import colors
-            from reportlab.lib.pagesizes import letter
-            from reportlab.lib.styles import getSampleStyleSheet
-            from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-        except Exception:
-            return Response(
-                {"detail": "Instala reportlab para generar PDF (pip install reportlab)."},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            )
-
-        municipality = movements.first().municipality
+        municipality = movements[0].municipality
         username = request.user.get_full_name() or request.user.username
-        date_label = timezone.localdate().strftime("%d/%m/%Y")
-
         buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=letter, topMargin=230, bottomMargin=60)
-        styles = getSampleStyleSheet()
-        elements = []
-
-        data = [["No.", "Codigo", "Material medico", "Cantidad"]]
-        row_index = 1
-        for movement in movements:
-            data.append(
-                [
-                    str(row_index),
-                    movement.medication.code,
-                    movement.medication.material_name,
-                    str(movement.quantity),
-                ]
-            )
-            row_index += 1
-
-        table = Table(data, hAlign="CENTER", colWidths=[35, 70, 360, 70])
-        table.setStyle(
-            TableStyle(
-                [
-                    ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#1f4f9c")),
-                    ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
-                    ("GRID", (0, 0), (-1, -1), 0.5, colors.HexColor("#cfd8e6")),
-                    ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-                    ("FONTSIZE", (0, 0), (-1, -1), 9),
-                    ("ROWBACKGROUNDS", (0, 1), (-1, -1), [colors.white, colors.HexColor("#f3f6fb")]),
-                    ("ALIGN", (0, 0), (1, -1), "CENTER"),
-                    ("ALIGN", (2, 0), (2, -1), "LEFT"),
-                    ("ALIGN", (3, 0), (3, -1), "CENTER"),
-                    ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
-                    ("LEFTPADDING", (0, 0), (-1, -1), 8),
-                    ("RIGHTPADDING", (0, 0), (-1, -1), 8),
-                    ("TOPPADDING", (0, 0), (-1, -1), 6),
-                    ("BOTTOMPADDING", (0, 0), (-1, -1), 6),
-                ]
-            )
-        )
-        elements.append(Spacer(1, 8))
-        elements.append(table)
-        elements.append(Spacer(1, 10))
-        notes_text = movements.first().notes or "-"
-        notes_style = styles["Normal"].clone("notes_style")
-        notes_style.fontSize = 9
-        elements.append(Paragraph(f"Observaciones: {notes_text}", notes_style))
-
-        footer_style = styles["Normal"].clone("footer_style")
-        footer_style.alignment = 1
-        footer_style.fontSize = 9
-        elements.append(Spacer(1, 18))
-        elements.append(Paragraph("Despacho generado automaticamente por el sistema SISAS", footer_style))
-
-        def draw_header(canvas_obj, doc_obj):
-            canvas_obj.saveState()
-            width, height = letter
-            header_top = height - 40
-            canvas_obj.setFillColor(colors.HexColor("#1f4f9c"))
-            canvas_obj.rect(0, header_top - 90, width, 90, fill=1, stroke=0)
-            canvas_obj.setFillColor(colors.white)
-            canvas_obj.setFont("Helvetica-Bold", 16)
-            canvas_obj.drawCentredString(width / 2, header_top - 40, "DESPACHO DE INSUMOS")
-            canvas_obj.setFont("Helvetica-Bold", 20)
-            canvas_obj.drawCentredString(width / 2, header_top - 65, "INSUMOS / REACTIVOS")
-
-            canvas_obj.setFillColor(colors.HexColor("#0f2c5c"))
-            canvas_obj.setFont("Helvetica-Bold", 12)
-            canvas_obj.drawCentredString(
-                width / 2,
-                height - 15,
-                "DIRECCION DE AREA DE SALUD DE SOLOLÁ",
-            )
-
-            canvas_obj.setFillColor(colors.HexColor("#eef3fb"))
-            info_box_top = header_top - 105
-            canvas_obj.roundRect(60, info_box_top - 45, width - 120, 45, 8, fill=1, stroke=0)
-            canvas_obj.setFillColor(colors.HexColor("#0f2c5c"))
-            canvas_obj.setFont("Helvetica-Bold", 10)
-            canvas_obj.drawString(80, info_box_top - 20, f"Municipio: {municipality.name if municipality else '-'}")
-            canvas_obj.drawString(80, info_box_top - 35, f"Fecha: {date_label}")
-            canvas_obj.drawString(width / 2 + 10, info_box_top - 20, f"Usuario: {username}")
-            canvas_obj.restoreState()
-
-        doc.build(elements, onFirstPage=draw_header)
+        try:
+            render_dispatch_pdf([build_dispatch_slip(movements, username, timezone.localdate())], buffer)
+        except ReportDependencyError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         pdf = buffer.getvalue()
         buffer.close()
 
@@ -509,6 +628,81 @@ class MovementViewSet(viewsets.ModelViewSet):
         response["Content-Disposition"] = f'attachment; filename="{filename}"'
         return response
 
+    @action(detail=False, methods=["post"], url_path="dispatch-report/batch")
+    def dispatch_report_batch(self, request):
+        output_format = str(request.data.get("format") or "pdf").lower()
+        if output_format not in {"pdf", "zip"}:
+            return Response({"detail": "format debe ser pdf o zip."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Todos los despachos salen de una sola consulta.
+        queryset = (
+            self.get_queryset().select_related("dispatch").order_by("municipality__name", "created_at", "id")
+        )
+        groups = request.data.get("groups")
+        if groups is not None:
+            if not isinstance(groups, list) or not all(
+                isinstance(group, list) and group and all(str(pk).isdigit() for pk in group)
+                for group in groups
+            ):
+                return Response(
+                    {"detail": "groups debe ser una lista de listas de ids."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            movements = {
+                movement.id: movement
+                for movement in queryset.filter(id__in={int(pk) for group in groups for pk in group})
+            }
+            slip_groups = []
+            for group in groups:
+                group_movements = sorted(
+                    (movements[int(pk)] for pk in set(group) if int(pk) in movements),
+                    key=lambda movement: movement.id,
+                )
+                if group_movements:
+                    # Reimprimir un despacho viejo muestra su fecha, no la de hoy.
+                    slip_day = timezone.localtime(group_movements[0].created_at).date()
+                    slip_groups.append((slip_day, group_movements))
+        else:
+            date_from = request.data.get("date_from")
+            date_to = request.data.get("date_to")
+            if not date_from or not date_to:
+                return Response(
+                    {"detail": "Envia groups o date_from y date_to."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            queryset = queryset.filter(
+                type="egreso",
+                **date_range_filter(
+                    parse_filter_date(str(date_from), "date_from"),
+                    parse_filter_date(str(date_to), "date_to"),
+                ),
+            )
+            if request.data.get("municipality"):
+                queryset = queryset.filter(
+                    municipality_id=parse_filter_id(request.data["municipality"], "municipality")
+                )
+            slip_groups = group_dispatch_movements_by_day(queryset)
+
+        if not slip_groups:
+            return Response({"detail": "Movimientos no encontrados."}, status=status.HTTP_404_NOT_FOUND)
+
+        username = request.user.get_full_name() or request.user.username
+        slips = [build_dispatch_slip(group, username, day) for day, group in slip_groups]
+        buffer = BytesIO()
+        try:
+            if output_format == "zip":
+                render_dispatch_zip(slips, buffer)
+            else:
+                render_dispatch_pdf(slips, buffer)
+        except ReportDependencyError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        filename = f"despachos_{timezone.localdate():%Y%m%d}.{output_format}"
+        content_type = ZIP_CONTENT_TYPE if output_format == "zip" else PDF_CONTENT_TYPE
+        response = HttpResponse(buffer.getvalue(), content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
     @action(detail=False, methods=["post"])
     def bulk(self, request):
         items = request.data if isinstance(request.data, list) else request.data.get("items")
@@ -518,25 +712,10 @@ class MovementViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        municipality_name = ""
-        if hasattr(request.user, "profile"):
-            municipality_name = (request.user.profile.municipality or "").strip()
-
-        def normalize(text: str) -> str:
-            normalized = unicodedata.normalize("NFKD", text)
-            return "".join([char for char in normalized if not unicodedata.combining(char)]).lower().strip()
-
+        municipality_name = get_profile_municipality_name(request.user)
         default_municipality = None
         if municipality_name:
-            normalized_name = normalize(municipality_name)
-            default_municipality = Municipality.objects.filter(name__iexact=municipality_name).first()
-            if not default_municipality and normalized_name:
-                for existing in Municipality.objects.all():
-                    if normalize(existing.name) == normalized_name:
-                        default_municipality = existing
-                        break
-            if not default_municipality:
-                default_municipality = Municipality.objects.create(name=municipality_name)
+            default_municipality = get_or_create_municipality_by_name(municipality_name)
 
         prepared = []
         municipality_cache = {}
@@ -603,60 +782,14 @@ class MovementViewSet(viewsets.ModelViewSet):
                 }
             )
 
-        def apply_movements():
-            with transaction.atomic():
-                movements = []
-                for item in prepared:
-                    medication = (
-                        Medication.objects.select_for_update()
-                        .filter(pk=item["medication_id"])
-                        .first()
-                    )
-                    if not medication:
-                        return Response(
-                            {"detail": "Medicamento no existe."},
-                            status=status.HTTP_400_BAD_REQUEST,
-                        )
-
-                    municipality_stock = MunicipalityStock.objects.select_for_update().filter(
-                        municipality=item["municipality"], medication=medication
-                    ).first()
-                    if not municipality_stock:
-                        municipality_stock = MunicipalityStock.objects.create(
-                            municipality=item["municipality"], medication=medication, stock=0
-                        )
-
-                    if item["type"] == "egreso":
-                        if municipality_stock.stock < item["quantity"]:
-                            return Response(
-                                {"detail": "Stock insuficiente en el municipio."},
-                                status=status.HTTP_400_BAD_REQUEST,
-                            )
-                        municipality_stock.stock -= item["quantity"]
-                    else:
-                        municipality_stock.stock += item["quantity"]
-
-                    municipality_stock.save(update_fields=["stock", "updated_at"])
-                    medication.physical_stock = (
-                        MunicipalityStock.objects.filter(medication=medication).aggregate(
-                            total=models.Sum("stock")
-                        ).get("total")
-                        or 0
-                    )
-                    medication.save(update_fields=["physical_stock", "updated_at"])
-
-                    movement = Movement.objects.create(
-                        type=item["type"],
-                        medication=medication,
-                        municipality=item["municipality"],
-                        user=request.user,
-                        quantity=item["quantity"],
-                        notes=item["notes"],
-                    )
-                    movements.append(movement)
-            return movements
+        def apply_bulk():
+            try:
+                with transaction.atomic():
+                    return apply_movements(prepared, request.user, with_dispatch=True)
+            except MovementError as exc:
+                return Response({"detail": exc.detail}, status=status.HTTP_400_BAD_REQUEST)
 
-        movements = self._with_retry(apply_movements)
+        movements = self._with_retry(apply_bulk)
         if isinstance(movements, Response):
             return movements
 
@@ -711,79 +844,28 @@ class MovementViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_400_BAD_REQUEST,
                 )
         else:
-            municipality_name = ""
-            if hasattr(request.user, "profile"):
-                municipality_name = (request.user.profile.municipality or "").strip()
-
+            municipality_name = get_profile_municipality_name(request.user)
             if not municipality_name:
                 return Response(
                     {"detail": "El usuario no tiene municipio asignado."},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
-
-            def normalize(text: str) -> str:
-                normalized = unicodedata.normalize("NFKD", text)
-                return "".join([char for char in normalized if not unicodedata.combining(char)]).lower().strip()
-
-            normalized_name = normalize(municipality_name)
-            municipality = Municipality.objects.filter(name__iexact=municipality_name).first()
-            if not municipality and normalized_name:
-                for existing in Municipality.objects.all():
-                    if normalize(existing.name) == normalized_name:
-                        municipality = existing
-                        break
-            if not municipality:
-                municipality = Municipality.objects.create(name=municipality_name)
+            municipality = get_or_create_municipality_by_name(municipality_name)
+
+        item = {
+            "type": movement_type,
+            "medication_id": medication_id,
+            "quantity": quantity,
+            "notes": notes,
+            "municipality": municipality,
+        }
 
         def apply_single():
-            with transaction.atomic():
-                medication = (
-                    Medication.objects.select_for_update()
-                    .filter(pk=medication_id)
-                    .first()
-                )
-                if not medication:
-                    return Response(
-                        {"detail": "Medicamento no existe."},
-                        status=status.HTTP_400_BAD_REQUEST,
-                    )
-
-                municipality_stock = MunicipalityStock.objects.select_for_update().filter(
-                    municipality=municipality, medication=medication
-                ).first()
-                if not municipality_stock:
-                    municipality_stock = MunicipalityStock.objects.create(
-                        municipality=municipality, medication=medication, stock=0
-                    )
-
-                if movement_type == "egreso":
-                    if municipality_stock.stock < quantity:
-                        return Response(
-                            {"detail": "Stock insuficiente en el municipio."},
-                            status=status.HTTP_400_BAD_REQUEST,
-                        )
-                    municipality_stock.stock -= quantity
-                else:
-                    municipality_stock.stock += quantity
-
-                municipality_stock.save(update_fields=["stock", "updated_at"])
-                medication.physical_stock = (
-                    MunicipalityStock.objects.filter(medication=medication).aggregate(
-                        total=models.Sum("stock")
-                    ).get("total")
-                    or 0
-                )
-                medication.save(update_fields=["physical_stock", "updated_at"])
-
-                movement = Movement.objects.create(
-                    type=movement_type,
-                    medication=medication,
-                    municipality=municipality,
-                    user=request.user,
-                    quantity=quantity,
-                    notes=notes,
-                )
-            return movement
+            try:
+                with transaction.atomic():
+                    return apply_movements([item], request.user)[0]
+            except MovementError as exc:
+                return Response({"detail": exc.detail}, status=status.HTTP_400_BAD_REQUEST)
 
         movement = self._with_retry(apply_single)
         if isinstance(movement, Response):
@@ -806,3 +888,62 @@ class MovementViewSet(viewsets.ModelViewSet):
             {"detail": "Base de datos ocupada. Intenta de nuevo."},
             status=status.HTTP_503_SERVICE_UNAVAILABLE,
         )
+
+
+class DispatchViewSet(viewsets.ReadOnlyModelViewSet):
+    permission_classes = [MedicationAccessPermission]
+    pagination_class = MovementCursorPagination
+
+    def get_queryset(self):
+        queryset = Dispatch.objects.select_related("municipality", "user").annotate(
+            line_count=models.Count("movements"),
+            total_quantity=models.Sum("movements__quantity"),
+        )
+        if self.action != "list":
+            queryset = queryset.prefetch_related(
+                models.Prefetch("movements", queryset=Movement.objects.select_related("medication").order_by("id"))
+            )
+        return scope_to_user_municipality(queryset.order_by("-created_at", "-id"), self.request.user)
+
+    def get_serializer_class(self):
+        if self.action == "list":
+            return DispatchSerializer
+        return DispatchDetailSerializer
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action != "list":
+            return queryset
+        params = self.request.query_params
+        date_from = params.get("date_from")
+        date_to = params.get("date_to")
+        queryset = queryset.filter(
+            **date_range_filter(
+                parse_filter_date(date_from, "date_from") if date_from else None,
+                parse_filter_date(date_to, "date_to") if date_to else None,
+            )
+        )
+        if params.get("municipality"):
+            queryset = queryset.filter(
+                municipality_id=parse_filter_id(params["municipality"], "municipality")
+            )
+        return queryset
+
+    @action(detail=True, methods=["get"])
+    def report(self, request, pk=None):
+        dispatch = self.get_object()
+        movements = list(dispatch.movements.all())
+        if not movements:
+            return Response({"detail": "El despacho no tiene movimientos."}, status=status.HTTP_404_NOT_FOUND)
+
+        username = request.user.get_full_name() or request.user.username
+        slip = build_dispatch_slip(movements, username, timezone.localtime(dispatch.created_at).date())
+        buffer = BytesIO()
+        try:
+            render_dispatch_pdf([slip], buffer)
+        except ReportDependencyError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        response = HttpResponse(buffer.getvalue(), content_type=PDF_CONTENT_TYPE)
+        response["Content-Disposition"] = f'attachment; filename="despacho_{dispatch.number}.pdf"'
+        return response
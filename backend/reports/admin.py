@@ -0,0 +1,9 @@
+from django.contrib import admin
+
+from reports.models import ReportJob
+
+
+@admin.register(ReportJob)
+class ReportJobAdmin(admin.ModelAdmin):
+    list_display = ("kind", "status", "requested_by", "created_at", "finished_at")
+    list_filter = ("kind", "status")
@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+import time
+from datetime import date
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import Count, Max, Q, Sum
+from django.http import FileResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+
+from medications.models import Medication, Municipality, Movement, MunicipalityStock, StockMonthClose
+from medications.periods import month_bounds, month_range_filter
+
+REPORT_CACHE_MAX_AGE_SECONDS = 2 * 24 * 60 * 60
+
+
+def get_report_data_version(year_value: int, month_value: int, municipality_id=None, medication_ids=None):
+    """Huella de los datos que lee un reporte mensual.
+
+    Cambia con cualquier alta, baja o edicion de movimientos del mes o de los
+    medicamentos que lista el reporte. La existencia del mes en curso es el
+    stock actual; la de un mes cerrado sale de balance_after
+    (get_report_stock_rows) y se versiona con la fila de StockMonthClose, que
+    las senales de Movement marcan al editar un movimiento de ese mes o de uno
+    anterior. Ninguna consulta recorre el historial.
+    """
+    month_start = date(year_value, month_value, 1)
+    _, month_end = month_bounds(month_start)
+    movements = Movement.objects.filter(**month_range_filter(year_value, month_value))
+    stocks = MunicipalityStock.objects.all()
+    medications = Medication.objects.all()
+    if municipality_id is not None:
+        movements = movements.filter(municipality_id=municipality_id)
+        stocks = stocks.filter(municipality_id=municipality_id)
+    if medication_ids:
+        movements = movements.filter(medication_id__in=medication_ids)
+        stocks = stocks.filter(medication_id__in=medication_ids)
+        medications = medications.filter(id__in=medication_ids)
+
+    parts = [
+        movements.aggregate(
+            count=Count("id"),
+            last_id=Max("id"),
+            ingresos=Sum("quantity", filter=Q(type="ingreso")),
+            egresos=Sum("quantity", filter=Q(type="egreso")),
+        ),
+        # Solo los campos que imprime el reporte: updated_at del catalogo
+        # cambia con cada movimiento (physical_stock).
+        list(medications.order_by("id").values_list("id", "code", "material_name")),
+    ]
+    month_close = None
+    if month_end <= timezone.now():
+        month_close = StockMonthClose.objects.filter(month=month_start).values("closed_at", "changed_at").first()
+    if month_close is None:
+        # Mes en curso, o terminado sin cierre: se versiona con el stock actual,
+        # que tambien se mueve al editar movimientos anteriores.
+        parts.append(stocks.aggregate(count=Count("id"), total=Sum("stock"), updated_at=Max("updated_at")))
+    else:
+        # Las filas del reporte siguen siendo las de MunicipalityStock.
+        parts.append(month_close)
+        parts.append(stocks.aggregate(count=Count("id"), last_id=Max("id")))
+    if municipality_id is None:
+        parts.append(Municipality.objects.aggregate(count=Count("id"), last_id=Max("id")))
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def get_report_cache_key(**key_parts) -> str:
+    payload = json.dumps(key_parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _prune_report_cache(cache_dir: Path):
+    # Las claves incluyen la fecha impresa en el reporte, asi que ninguna
+    # entrada sirve mas de un dia; se limpia al escribir una nueva.
+    cutoff = time.time() - REPORT_CACHE_MAX_AGE_SECONDS
+    for entry in cache_dir.iterdir():
+        try:
+            if entry.stat().st_mtime < cutoff:
+                entry.unlink()
+        except OSError:
+            continue
+
+
+def cached_report_response(request, cache_key: str, filename: str, content_type: str, render):
+    """Sirve un reporte renderizado desde disco, generandolo si no existe.
+
+    render(output) solo se llama cuando falta el archivo. El nombre del archivo
+    es la clave, por lo que una version nueva de los datos produce otro
+    archivo y el ETag permite responder 304 sin leerlo.
+    """
+    etag = quote_etag(cache_key)
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        not_modified["Cache-Control"] = "private, no-cache"
+        return not_modified
+
+    cache_dir = Path(settings.REPORTS_CACHE_DIR)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    file_path = cache_dir / f"{cache_key}{Path(filename).suffix}"
+    if not file_path.exists():
+        temp_path = cache_dir / f"{cache_key}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, "wb") as output:
+                render(output)
+            os.replace(temp_path, file_path)
+        finally:
+            if temp_path.exists():
+                temp_path.unlink()
+        _prune_report_cache(cache_dir)
+
+    response = FileResponse(open(file_path, "rb"), content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    response["ETag"] = etag
+    response["Cache-Control"] = "private, no-cache"
+    return response
+
@@ -0,0 +1,201 @@
+from datetime import date
+
+from django.db.models import Case, Count, F, IntegerField, Q, Sum, When
+from django.utils import timezone
+
+from medications.balances import stock_as_of
+
+from medications.municipality_catalog import (
+    ORDERED_MUNICIPALITY_NAMES,
+    get_display_municipality_name,
+)
+from medications.models import Medication, Municipality, Movement, MunicipalityStock
+from medications.periods import month_bounds, month_range_filter
+
+
+def get_report_municipality_names() -> list[str]:
+    return list(ORDERED_MUNICIPALITY_NAMES)
+
+
+def get_report_stock_rows(year_value: int, month_value: int):
+    """Stock por municipio con la existencia que muestra el reporte.
+
+    Para meses cerrados es el stock al cierre del mes (Movement.balance_after);
+    para el mes en curso, el stock actual.
+    """
+    _, month_end = month_bounds(date(year_value, month_value, 1))
+    stocks = MunicipalityStock.objects.order_by()
+    if month_end <= timezone.now():
+        return stocks.annotate(report_stock=stock_as_of(month_end))
+    return stocks.annotate(report_stock=F("stock"))
+
+
+def build_municipality_medication_report(municipality, year_value: int, month_value: int):
+    medications = list(
+        Medication.objects.order_by("material_name").values("id", "code", "material_name")
+    )
+    stock_map = dict(
+        get_report_stock_rows(year_value, month_value)
+        .filter(municipality=municipality)
+        .values_list("medication_id", "report_stock")
+    )
+    movement_rows = (
+        Movement.objects.filter(
+            municipality=municipality,
+            **month_range_filter(year_value, month_value),
+        )
+        .values("medication_id")
+        .annotate(
+            ingresos=Sum(
+                Case(
+                    When(type="ingreso", then="quantity"),
+                    default=0,
+                    output_field=IntegerField(),
+                )
+            ),
+            egresos=Sum(
+                Case(
+                    When(type="egreso", then="quantity"),
+                    default=0,
+                    output_field=IntegerField(),
+                )
+            ),
+        )
+    )
+    movement_map = {
+        row["medication_id"]: {
+            "ingresos": row["ingresos"] or 0,
+            "egresos": row["egresos"] or 0,
+        }
+        for row in movement_rows
+    }
+
+    items = []
+    total_ingresos = 0
+    total_egresos = 0
+    total_quantity = 0
+
+    for medication in medications:
+        medication_id = medication["id"]
+        ingresos = movement_map.get(medication_id, {}).get("ingresos", 0)
+        egresos = movement_map.get(medication_id, {}).get("egresos", 0)
+        stock = stock_map.get(medication_id, 0)
+        items.append(
+            {
+                "code": medication["code"],
+                "material_name": medication["material_name"],
+                "ingresos": ingresos,
+                "egresos": egresos,
+                "real_time_stock": stock,
+            }
+        )
+        total_ingresos += ingresos
+        total_egresos += egresos
+        total_quantity += ingresos + egresos
+
+    return {
+        "items": items,
+        "total_quantity": total_quantity,
+        "total_ingresos": total_ingresos,
+        "total_egresos": total_egresos,
+    }
+
+
+def build_consolidated_report_matrix(year_value: int, month_value: int, medication_ids=None):
+    """Datos del consolidado mensual compartidos por PDF y Excel.
+
+    matrix[(municipio, medication_id)] = (ingresos, egresos, existencia),
+    agrupando por nombre de catalogo. Sale de una sola agregacion condicional
+    sobre los movimientos del mes y una consulta de stock.
+    """
+    medications = Medication.objects.order_by("material_name")
+    movement_rows = Movement.objects.filter(**month_range_filter(year_value, month_value))
+    stock_rows = get_report_stock_rows(year_value, month_value)
+    if medication_ids:
+        medications = medications.filter(id__in=medication_ids)
+        movement_rows = movement_rows.filter(medication_id__in=medication_ids)
+        stock_rows = stock_rows.filter(medication_id__in=medication_ids)
+
+    municipality_display_by_id = {
+        municipality_id: get_display_municipality_name(name)
+        for municipality_id, name in Municipality.objects.values_list("id", "name")
+    }
+
+    matrix: dict[tuple[str, int], tuple[int, int, int]] = {}
+    total_movements = 0
+    total_ingresos = 0
+    total_egresos = 0
+    for row in (
+        movement_rows.values("municipality_id", "medication_id")
+        .annotate(
+            ingresos=Sum("quantity", filter=Q(type="ingreso")),
+            egresos=Sum("quantity", filter=Q(type="egreso")),
+            ingreso_count=Count("id", filter=Q(type="ingreso")),
+            egreso_count=Count("id", filter=Q(type="egreso")),
+        )
+        .order_by()
+    ):
+        total_ingresos += row["ingreso_count"]
+        total_egresos += row["egreso_count"]
+        total_movements += row["ingreso_count"] + row["egreso_count"]
+        municipality_name = municipality_display_by_id.get(row["municipality_id"])
+        if not municipality_name:
+            continue
+        key = (municipality_name, row["medication_id"])
+        ingresos, egresos, stock = matrix.get(key, (0, 0, 0))
+        matrix[key] = (ingresos + (row["ingresos"] or 0), egresos + (row["egresos"] or 0), stock)
+
+    for municipality_id, medication_id, stock_value in stock_rows.values_list(
+        "municipality_id", "medication_id", "report_stock"
+    ):
+        municipality_name = municipality_display_by_id.get(municipality_id)
+        if not municipality_name:
+            continue
+        key = (municipality_name, medication_id)
+        ingresos, egresos, stock = matrix.get(key, (0, 0, 0))
+        matrix[key] = (ingresos, egresos, stock + (stock_value or 0))
+
+    return {
+        "medication_items": list(medications.values_list("id", "material_name")),
+        "municipality_names": get_report_municipality_names(),
+        "matrix": matrix,
+        "total_movements": total_movements,
+        "total_ingresos": total_ingresos,
+        "total_egresos": total_egresos,
+    }
+
+
+def build_dispatch_slip(movements, username: str, slip_date):
+    # Datos simples (sin modelos) para poder dibujarlo en otro proceso.
+    first = movements[0]
+    number = ""
+    if first.dispatch_id and len({movement.dispatch_id for movement in movements}) == 1:
+        number = first.dispatch.number or ""
+    return {
+        "municipality": first.municipality.name if first.municipality else "",
+        "date": slip_date,
+        "number": number,
+        "username": username,
+        "notes": first.notes,
+        "rows": [
+            (movement.medication.code, movement.medication.material_name, movement.quantity)
+            for movement in movements
+        ],
+    }
+
+
+def group_dispatch_movements_by_day(movements):
+    """Agrupa las salidas en despachos: uno por Dispatch.
+
+    Las salidas anteriores al modelo Dispatch (sin despacho) se agrupan por
+    municipio y dia local, como se imprimian antes.
+    """
+    groups = {}
+    for movement in movements:
+        day = timezone.localtime(movement.created_at).date()
+        if movement.dispatch_id:
+            key = ("dispatch", movement.dispatch_id)
+        else:
+            key = (movement.municipality_id, day)
+        groups.setdefault(key, (day, []))[1].append(movement)
+    return list(groups.values())
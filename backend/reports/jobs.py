@@ -0,0 +1,177 @@
+import hashlib
+import json
+import os
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from medications.models import Municipality
+from reports.cache import get_report_data_version
+from reports.data import build_consolidated_report_matrix, build_municipality_medication_report
+from reports.models import ReportJob
+from reports.rendering import (
+    render_consolidated_excel,
+    render_consolidated_pdf,
+    render_municipality_excel,
+    render_municipality_pdf,
+)
+
+
+def get_report_params_hash(kind: str, params: dict) -> str:
+    payload = json.dumps({"kind": kind, "params": params}, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def get_job_data_version(params: dict) -> str:
+    # La misma huella que usa la cache de reportes: cambia con altas, bajas y
+    # ediciones dentro del alcance del reporte.
+    return get_report_data_version(
+        params["year"],
+        params["month"],
+        municipality_id=params.get("municipality_id"),
+        medication_ids=params.get("medication_ids") or None,
+    )
+
+
+def enqueue_report_job(kind: str, params: dict, user):
+    """Devuelve (job, created) reutilizando un trabajo equivalente si existe.
+
+    Un trabajo pendiente o en proceso con los mismos parametros se comparte;
+    uno terminado solo si su archivo sigue en disco y la huella de los datos
+    del reporte no cambio desde que empezo a generarse.
+    """
+    params_hash = get_report_params_hash(kind, params)
+    active_job = (
+        ReportJob.objects.filter(
+            params_hash=params_hash,
+            status__in=[ReportJob.STATUS_PENDING, ReportJob.STATUS_RUNNING],
+        )
+        .order_by("-created_at")
+        .first()
+    )
+    if active_job:
+        return active_job, False
+
+    done_job = (
+        ReportJob.objects.filter(params_hash=params_hash, status=ReportJob.STATUS_DONE)
+        .order_by("-finished_at")
+        .first()
+    )
+    if (
+        done_job
+        and done_job.data_version
+        and os.path.exists(done_job.file_path)
+        and done_job.data_version == get_job_data_version(done_job.params)
+    ):
+        return done_job, False
+
+    job = ReportJob.objects.create(
+        kind=kind,
+        params=params,
+        params_hash=params_hash,
+        requested_by=user if user and user.is_authenticated else None,
+    )
+    return job, True
+
+
+def claim_next_report_job():
+    with transaction.atomic():
+        job = (
+            ReportJob.objects.select_for_update(skip_locked=True)
+            .filter(status=ReportJob.STATUS_PENDING)
+            .order_by("created_at")
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = ReportJob.STATUS_RUNNING
+        job.started_at = timezone.now()
+        job.save(update_fields=["status", "started_at"])
+    return job
+
+
+def requeue_stale_report_jobs(max_age: timedelta) -> int:
+    # Trabajos que quedaron "en proceso" porque el worker se detuvo.
+    return ReportJob.objects.filter(
+        status=ReportJob.STATUS_RUNNING,
+        started_at__lt=timezone.now() - max_age,
+    ).update(status=ReportJob.STATUS_PENDING, started_at=None)
+
+
+def get_report_storage_dir() -> Path:
+    storage_dir = Path(settings.REPORTS_STORAGE_DIR)
+    storage_dir.mkdir(parents=True, exist_ok=True)
+    return storage_dir
+
+
+def _render_report_job(job, output):
+    params = job.params
+    year_value = params["year"]
+    month_value = params["month"]
+    is_excel = params["export_format"] == "excel"
+    username = ""
+    if job.requested_by:
+        username = job.requested_by.get_full_name() or job.requested_by.username
+    extension = "xlsx" if is_excel else "pdf"
+
+    if job.kind == "municipality":
+        municipality = Municipality.objects.get(pk=params["municipality_id"])
+        report_data = build_municipality_medication_report(municipality, year_value, month_value)
+        render = render_municipality_excel if is_excel else render_municipality_pdf
+        render(report_data, municipality.name, username, output)
+        return f"reporte_{municipality.name}_{year_value}-{month_value:02d}.{extension}"
+
+    report_data = build_consolidated_report_matrix(
+        year_value, month_value, params.get("medication_ids") or None
+    )
+    render = render_consolidated_excel if is_excel else render_consolidated_pdf
+    render(report_data, username, output)
+    return f"reporte_todos_municipios_{year_value}-{month_value:02d}.{extension}"
+
+
+def run_report_job(job):
+    extension = "xlsx" if job.params.get("export_format") == "excel" else "pdf"
+    file_path = get_report_storage_dir() / f"{job.id}_{job.params_hash[:16]}.{extension}"
+    temp_path = file_path.with_suffix(f".{extension}.tmp")
+    try:
+        # Se toma antes de leer los datos: un cambio durante la generacion
+        # deja el archivo con una huella vieja y no se reutiliza.
+        job.data_version = get_job_data_version(job.params)
+        with open(temp_path, "wb") as output:
+            file_name = _render_report_job(job, output)
+        os.replace(temp_path, file_path)
+    except Exception as exc:
+        if temp_path.exists():
+            temp_path.unlink()
+        if isinstance(exc, Municipality.DoesNotExist):
+            exc = "Municipio invalido."
+        job.status = ReportJob.STATUS_FAILED
+        job.error = str(exc)[:2000]
+        job.finished_at = timezone.now()
+        job.save(update_fields=["status", "error", "finished_at"])
+        return job
+
+    job.status = ReportJob.STATUS_DONE
+    job.file_name = file_name
+    job.file_path = str(file_path)
+    job.finished_at = timezone.now()
+    job.save(update_fields=["status", "file_name", "file_path", "data_version", "finished_at"])
+    discard_superseded_report_jobs(job)
+    return job
+
+
+def discard_superseded_report_jobs(job):
+    # Se borra el archivo pero la fila queda: quien siga consultando el
+    # trabajo viejo recibe un estado final que apunta al nuevo.
+    superseded = ReportJob.objects.filter(
+        params_hash=job.params_hash,
+        status=ReportJob.STATUS_DONE,
+        finished_at__lt=job.finished_at,
+    )
+    for file_path in superseded.values_list("file_path", flat=True):
+        if file_path and os.path.exists(file_path):
+            os.remove(file_path)
+    superseded.update(status=ReportJob.STATUS_SUPERSEDED, superseded_by=job, file_path="")
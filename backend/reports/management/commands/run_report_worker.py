@@ -0,0 +1,50 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from reports.jobs import claim_next_report_job, requeue_stale_report_jobs, run_report_job
+from reports.rendering import warm_pdf_kit
+
+
+class Command(BaseCommand):
+    help = "Procesa los trabajos de reportes encolados en la base de datos."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Procesa los trabajos pendientes y termina.",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=2.0,
+            help="Segundos de espera cuando no hay trabajos pendientes.",
+        )
+        parser.add_argument(
+            "--stale-minutes",
+            type=int,
+            default=30,
+            help="Reencola trabajos en proceso con mas de estos minutos.",
+        )
+
+    def handle(self, *args, **options):
+        warm_pdf_kit()
+        stale_age = timedelta(minutes=options["stale_minutes"])
+        requeued = requeue_stale_report_jobs(stale_age)
+        if requeued:
+            self.stdout.write(f"{requeued} trabajos reencolados.")
+
+        while True:
+            job = claim_next_report_job()
+            if job is None:
+                if options["once"]:
+                    return
+                time.sleep(options["poll_interval"])
+                continue
+            job = run_report_job(job)
+            if job.status == job.STATUS_DONE:
+                self.stdout.write(f"Reporte {job.id} generado: {job.file_name}")
+            else:
+                self.stderr.write(f"Reporte {job.id} fallido: {job.error}")
@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReportJob",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("kind", models.CharField(choices=[("municipality", "Municipio"), ("consolidated", "Consolidado")], max_length=20)),
+                ("params", models.JSONField(default=dict)),
+                ("params_hash", models.CharField(max_length=64)),
+                ("status", models.CharField(choices=[("pending", "Pendiente"), ("running", "En proceso"), ("done", "Listo"), ("failed", "Fallido")], default="pending", max_length=10)),
+                ("file_name", models.CharField(blank=True, default="", max_length=255)),
+                ("file_path", models.CharField(blank=True, default="", max_length=500)),
+                ("error", models.TextField(blank=True, default="")),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("started_at", models.DateTimeField(blank=True, null=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+                ("requested_by", models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                "ordering": ["-created_at"],
+                "indexes": [models.Index(fields=["params_hash", "status"], name="reportjob_hash_status_idx"), models.Index(fields=["status", "created_at"], name="reportjob_status_created_idx")],
+            },
+        ),
+    ]
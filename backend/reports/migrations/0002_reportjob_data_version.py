@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("reports", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="reportjob",
+            name="data_version",
+            field=models.CharField(blank=True, default="", max_length=64),
+        ),
+    ]
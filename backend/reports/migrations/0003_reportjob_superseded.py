@@ -0,0 +1,22 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("reports", "0002_reportjob_data_version"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="reportjob",
+            name="superseded_by",
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name="+", to="reports.reportjob"),
+        ),
+        migrations.AlterField(
+            model_name="reportjob",
+            name="status",
+            field=models.CharField(choices=[("pending", "Pendiente"), ("running", "En proceso"), ("done", "Listo"), ("failed", "Fallido"), ("superseded", "Reemplazado")], default="pending", max_length=10),
+        ),
+    ]
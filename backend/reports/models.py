@@ -0,0 +1,48 @@
+from django.contrib.auth.models import User
+from django.db import models
+
+
+class ReportJob(models.Model):
+    KIND_CHOICES = [
+        ("municipality", "Municipio"),
+        ("consolidated", "Consolidado"),
+    ]
+    STATUS_PENDING = "pending"
+    STATUS_RUNNING = "running"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+    STATUS_SUPERSEDED = "superseded"
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Pendiente"),
+        (STATUS_RUNNING, "En proceso"),
+        (STATUS_DONE, "Listo"),
+        (STATUS_FAILED, "Fallido"),
+        (STATUS_SUPERSEDED, "Reemplazado"),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    params = models.JSONField(default=dict)
+    params_hash = models.CharField(max_length=64)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    file_name = models.CharField(max_length=255, blank=True, default="")
+    file_path = models.CharField(max_length=500, blank=True, default="")
+    data_version = models.CharField(max_length=64, blank=True, default="")
+    error = models.TextField(blank=True, default="")
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    # Trabajo mas reciente con los mismos parametros; el archivo de este se borra.
+    superseded_by = models.ForeignKey(
+        "self", on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["params_hash", "status"], name="reportjob_hash_status_idx"),
+            models.Index(fields=["status", "created_at"], name="reportjob_status_created_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.params} ({self.status})"
@@ -0,0 +1,673 @@
+import io
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from types import SimpleNamespace
+
+from django.utils import timezone
+
+EXCEL_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+PDF_CONTENT_TYPE = "application/pdf"
+ZIP_CONTENT_TYPE = "application/zip"
+
+# Con pocos despachos arrancar procesos cuesta mas que dibujarlos.
+PARALLEL_RENDER_MIN_SLIPS = 4
+
+
+class ReportDependencyError(Exception):
+    pass
+
+
+def _require_reportlab():
+    try:
+        import reportlab  # noqa: F401
+    except Exception as exc:
+        raise ReportDependencyError("Instala reportlab para generar PDF (pip install reportlab).") from exc
+
+
+def _require_openpyxl():
+    try:
+        import openpyxl  # noqa: F401
+    except Exception as exc:
+        raise ReportDependencyError("Instala openpyxl para generar EXCEL (pip install openpyxl).") from exc
+
+
+def register_excel_styles(workbook):
+    from openpyxl.styles import Alignment, Font, NamedStyle, PatternFill
+
+    named_styles = {
+        "header": NamedStyle(
+            name="sisas_header",
+            font=Font(color="FFFFFF", bold=True),
+            fill=PatternFill(start_color="1F4F9C", end_color="1F4F9C", fill_type="solid"),
+            alignment=Alignment(horizontal="center", vertical="center"),
+        ),
+        "title": NamedStyle(
+            name="sisas_title",
+            font=Font(bold=True),
+            alignment=Alignment(horizontal="center", vertical="center", wrap_text=True),
+        ),
+        "centered": NamedStyle(
+            name="sisas_centered",
+            alignment=Alignment(horizontal="center", vertical="center", wrap_text=True),
+        ),
+    }
+    for style in named_styles.values():
+        workbook.add_named_style(style)
+    return {key: style.name for key, style in named_styles.items()}
+
+
+@lru_cache(maxsize=None)
+def get_pdf_kit():
+    """Estilos y TableStyle de los PDF, construidos una vez por proceso."""
+    _require_reportlab()
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import landscape, letter
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import Flowable, PageBreak, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+    class PageMarker(Flowable):
+        # Flowable sin tamano que dibuja en coordenadas de pagina: sirve para
+        # poner el encabezado de cada despacho en la pagina donde empieza.
+        def __init__(self, draw):
+            super().__init__()
+            self._draw = draw
+
+        def wrap(self, available_width, available_height):
+            return 0, 0
+
+        def drawOn(self, canvas_obj, x, y, _sW=0):
+            self._draw(canvas_obj)
+
+    styles = getSampleStyleSheet()
+    cell_style = styles["BodyText"].clone("wrapped_cell_style")
+    cell_style.fontName = "Helvetica"
+    cell_style.fontSize = 8.5
+    cell_style.leading = 10
+    cell_style.spaceBefore = 0
+    cell_style.spaceAfter = 0
+    cell_style.wordWrap = "CJK"
+
+    footer_style = styles["Normal"].clone("footer_style")
+    footer_style.alignment = 1
+    footer_style.fontSize = 9
+
+    notes_style = styles["Normal"].clone("notes_style")
+    notes_style.fontSize = 9
+
+    primary = colors.HexColor("#1f4f9c")
+    grid_table_commands = [
+        ("BACKGROUND", (0, 0), (-1, 0), primary),
+        ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
+        ("GRID", (0, 0), (-1, -1), 0.5, colors.HexColor("#cfd8e6")),
+        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+        ("FONTSIZE", (0, 0), (-1, -1), 9),
+        ("ROWBACKGROUNDS", (0, 1), (-1, -1), [colors.white, colors.HexColor("#f3f6fb")]),
+    ]
+    padding_commands = [
+        ("LEFTPADDING", (0, 0), (-1, -1), 6),
+        ("RIGHTPADDING", (0, 0), (-1, -1), 6),
+        ("TOPPADDING", (0, 0), (-1, -1), 4),
+        ("BOTTOMPADDING", (0, 0), (-1, -1), 4),
+        ("LINEABOVE", (0, 0), (-1, 0), 0.5, primary),
+        ("LINEBELOW", (0, 0), (-1, 0), 0.5, primary),
+    ]
+
+    return SimpleNamespace(
+        colors=colors,
+        letter=letter,
+        landscape=landscape,
+        PageBreak=PageBreak,
+        PageMarker=PageMarker,
+        Paragraph=Paragraph,
+        SimpleDocTemplate=SimpleDocTemplate,
+        Spacer=Spacer,
+        Table=Table,
+        cell_style=cell_style,
+        footer_style=footer_style,
+        notes_style=notes_style,
+        summary_table_style=TableStyle(
+            [
+                ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#eef3fb")),
+                ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+                ("ALIGN", (0, 0), (2, -1), "LEFT"),
+                ("ALIGN", (3, 0), (3, -1), "LEFT"),
+                ("ALIGN", (4, 0), (4, -1), "LEFT"),
+                ("FONTNAME", (0, 0), (-1, -1), "Helvetica-Bold"),
+                ("FONTSIZE", (0, 0), (-1, -1), 9),
+                *padding_commands,
+                ("GRID", (0, 0), (-1, -1), 0.0, colors.white),
+            ]
+        ),
+        municipality_table_style=TableStyle(
+            [
+                *grid_table_commands,
+                ("ALIGN", (0, 0), (1, -1), "CENTER"),
+                ("ALIGN", (2, 0), (2, -1), "LEFT"),
+                ("ALIGN", (3, 0), (5, -1), "CENTER"),
+                ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+                *padding_commands,
+            ]
+        ),
+        consolidated_table_style=TableStyle(
+            [
+                *grid_table_commands,
+                ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+                ("ALIGN", (0, 0), (0, -1), "CENTER"),
+                ("ALIGN", (2, 0), (2, -1), "LEFT"),
+                ("ALIGN", (3, 0), (5, -1), "RIGHT"),
+            ]
+        ),
+        dispatch_table_style=TableStyle(
+            [
+                *grid_table_commands,
+                ("ALIGN", (0, 0), (1, -1), "CENTER"),
+                ("ALIGN", (2, 0), (2, -1), "LEFT"),
+                ("ALIGN", (3, 0), (3, -1), "CENTER"),
+                ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+                ("LEFTPADDING", (0, 0), (-1, -1), 8),
+                ("RIGHTPADDING", (0, 0), (-1, -1), 8),
+                ("TOPPADDING", (0, 0), (-1, -1), 6),
+                ("BOTTOMPADDING", (0, 0), (-1, -1), 6),
+            ]
+        ),
+    )
+
+
+def warm_pdf_kit():
+    # Se llama al arrancar gunicorn y el worker de reportes para que la
+    # primera solicitud no pague la importacion de reportlab.
+    try:
+        get_pdf_kit()
+    except ReportDependencyError:
+        pass
+
+
+def draw_static_form(canvas_obj, name: str, draw):
+    # El arte fijo del encabezado se guarda como form XObject: se dibuja una
+    # vez por documento y cada pagina solo lo referencia.
+    if not canvas_obj.hasForm(name):
+        canvas_obj.beginForm(name)
+        draw(canvas_obj)
+        canvas_obj.endForm()
+    canvas_obj.doForm(name)
+
+
+def _draw_municipality_header_art(canvas_obj):
+    colors = get_pdf_kit().colors
+    width, height = get_pdf_kit().letter
+    header_top = height - 40
+    canvas_obj.setFillColor(colors.HexColor("#1f4f9c"))
+    canvas_obj.rect(0, header_top - 90, width, 90, fill=1, stroke=0)
+    canvas_obj.setFillColor(colors.white)
+    canvas_obj.setFont("Helvetica-Bold", 16)
+    canvas_obj.drawCentredString(width / 2, header_top - 40, "REPORTE QUINCENAL DE")
+    canvas_obj.setFont("Helvetica-Bold", 20)
+    canvas_obj.drawCentredString(width / 2, header_top - 65, "INSUMOS / REACTIVOS")
+
+    canvas_obj.setFillColor(colors.HexColor("#0f2c5c"))
+    canvas_obj.setFont("Helvetica-Bold", 12)
+    canvas_obj.drawCentredString(
+        width / 2,
+        height - 15,
+        "DIRECCION DEPARTAMENTAL DE REDES INTEGRADAS DE SERVICIOS DE SALUD",
+    )
+
+    # Info box
+    canvas_obj.setFillColor(colors.HexColor("#eef3fb"))
+    info_box_top = header_top - 105
+    canvas_obj.roundRect(60, info_box_top - 45, width - 120, 45, 8, fill=1, stroke=0)
+
+    # Footer
+    canvas_obj.setFont("Helvetica", 9)
+    canvas_obj.setFillColor(colors.HexColor("#5f6b7a"))
+    canvas_obj.drawCentredString(width / 2, 30, "Direccion de Area de Salud de Sololá | 2026")
+
+
+def render_municipality_pdf(report_data, municipality_name: str, username: str, output):
+    kit = get_pdf_kit()
+    Paragraph, Spacer, Table = kit.Paragraph, kit.Spacer, kit.Table
+
+    doc = kit.SimpleDocTemplate(
+        output,
+        pagesize=kit.letter,
+        topMargin=20,
+        bottomMargin=20,
+        leftMargin=24,
+        rightMargin=24,
+    )
+    elements = []
+
+    total_movements = report_data["total_quantity"]
+    total_ingresos = report_data["total_ingresos"]
+    total_egresos = report_data["total_egresos"]
+
+    summary_data = [
+        ["", f"Total de movimientos: {total_movements}", "", f"Ingresos: {total_ingresos}", "", f"Egresos: {total_egresos}"],
+    ]
+    summary_table = Table(summary_data, hAlign="CENTER", colWidths=[14, 170, 14, 120, 10, 100])
+    summary_table.setStyle(kit.summary_table_style)
+    elements.append(Spacer(1, 170))
+    elements.append(summary_table)
+    elements.append(Spacer(1, 10))
+
+    data = [["No.", "Codigo", "Material medico", "Ingresos", "Egresos", "Existencia"]]
+    row_index = 1
+    for item in report_data["items"]:
+        data.append(
+            [
+                str(row_index),
+                Paragraph(str(item["code"]), kit.cell_style),
+                Paragraph(item["material_name"], kit.cell_style),
+                str(item["ingresos"]),
+                str(item["egresos"]),
+                str(item["real_time_stock"]),
+            ]
+        )
+        row_index += 1
+    table = Table(data, hAlign="CENTER", repeatRows=1, colWidths=[28, 78, 210, 55, 55, 85])
+    table.setStyle(kit.municipality_table_style)
+    elements.append(table)
+
+    elements.append(Spacer(1, 18))
+
+    elements.append(Paragraph("Reporte generado automaticamente por el sistema SISAS", kit.footer_style))
+
+    def draw_header(canvas_obj, doc_obj):
+        canvas_obj.saveState()
+        draw_static_form(canvas_obj, "municipality_header", _draw_municipality_header_art)
+        width, height = kit.letter
+        info_box_top = height - 145
+        canvas_obj.setFillColor(kit.colors.HexColor("#0f2c5c"))
+        canvas_obj.setFont("Helvetica-Bold", 10)
+        date_label = timezone.localdate().strftime("%d/%m/%Y")
+        canvas_obj.drawString(80, info_box_top - 20, f"DMS/RED LOCAL: {municipality_name}")
+        canvas_obj.drawString(width / 2 + 10, info_box_top - 20, f"Fecha: {date_label}")
+        canvas_obj.drawString(80, info_box_top - 35, f"Usuario: {username}")
+        canvas_obj.restoreState()
+
+    doc.build(elements, onFirstPage=draw_header)
+
+
+def render_municipality_excel(report_data, municipality_name: str, username: str, output):
+    _require_openpyxl()
+    from openpyxl import Workbook
+    from openpyxl.styles import Alignment, Font, PatternFill
+    from openpyxl.utils import get_column_letter
+
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Reporte"
+
+    header_fill = PatternFill(start_color="1F4F9C", end_color="1F4F9C", fill_type="solid")
+    header_font = Font(color="FFFFFF", bold=True)
+    title_font = Font(bold=True)
+    centered = Alignment(horizontal="center", vertical="center", wrap_text=True)
+
+    start_col_idx = 3
+    cols = [get_column_letter(start_col_idx + i) for i in range(6)]
+    title_row_1 = 5
+    title_row_2 = 6
+    dms_row = 7
+    date_row = 8
+    user_row = 9
+    table_header_row = 10
+
+    for row in [title_row_1, title_row_2, dms_row, date_row, user_row]:
+        ws.merge_cells(f"{cols[0]}{row}:{cols[-1]}{row}")
+
+    ws[f"{cols[0]}{title_row_1}"] = "DIRECCION DEPARTAMENTAL DE REDES INTEGRADAS DE SERVICIOS DE SALUD"
+    ws[f"{cols[0]}{title_row_2}"] = "REPORTE QUINCENAL DE INSUMOS / REACTIVOS"
+    ws[f"{cols[0]}{dms_row}"] = f"DMS/RED LOCAL: {municipality_name}"
+    ws[f"{cols[0]}{date_row}"] = f"Fecha: {timezone.localdate().strftime('%d/%m/%Y')}"
+    ws[f"{cols[0]}{user_row}"] = f"Usuario: {username}"
+
+    for row in [title_row_1, title_row_2, dms_row, date_row, user_row]:
+        ws[f"{cols[0]}{row}"].alignment = centered
+    ws[f"{cols[0]}{title_row_1}"].font = title_font
+    ws[f"{cols[0]}{title_row_2}"].font = title_font
+
+    headers = ["No.", "Codigo", "Material medico", "Ingresos", "Egresos", "Existencia"]
+    for idx, value in enumerate(headers):
+        cell = ws.cell(row=table_header_row, column=start_col_idx + idx, value=value)
+        cell.fill = header_fill
+        cell.font = header_font
+        cell.alignment = centered
+
+    row_number = 1
+    for item in report_data["items"]:
+        values = [
+            row_number,
+            item["code"],
+            item["material_name"],
+            item["ingresos"],
+            item["egresos"],
+            item["real_time_stock"],
+        ]
+        row_idx = ws.max_row + 1
+        for idx, value in enumerate(values):
+            ws.cell(row=row_idx, column=start_col_idx + idx, value=value).alignment = centered
+        row_number += 1
+
+    widths = {"C": 7, "D": 12, "E": 34, "F": 12, "G": 12, "H": 22}
+    for col, width in widths.items():
+        ws.column_dimensions[col].width = width
+
+    wb.save(output)
+
+
+def render_consolidated_excel(report_data, username: str, output):
+    _require_openpyxl()
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.utils import get_column_letter
+
+    medication_items = report_data["medication_items"]
+    ordered_municipality_names = report_data["municipality_names"]
+    matrix = report_data["matrix"]
+
+    # Libro en modo write-only: cada fila se escribe al archivo temporal
+    # de su hoja y no queda en memoria; luego se envia en bloques.
+    wb = Workbook(write_only=True)
+    styles = register_excel_styles(wb)
+    date_label = f"Fecha: {timezone.localdate().strftime('%d/%m/%Y')}"
+    start_col_idx = 3  # C
+    table_header_row = 10
+
+    def styled(sheet, value, style_name):
+        cell = WriteOnlyCell(sheet, value=value)
+        cell.style = style_name
+        return cell
+
+    def write_sheet(sheet, municipality_label, headers, widths, data_rows):
+        col_letters = [get_column_letter(start_col_idx + i) for i in range(len(headers))]
+        for col, width in zip(col_letters, widths):
+            sheet.column_dimensions[col].width = width
+        sheet.sheet_format.defaultRowHeight = 20
+        sheet.sheet_format.customHeight = True
+        sheet.row_dimensions[table_header_row].height = 22
+        sheet.freeze_panes = f"{col_letters[0]}{table_header_row + 1}"
+        sheet.print_options.horizontalCentered = True
+
+        padding = [None] * (start_col_idx - 1)
+        for _ in range(4):
+            sheet.append([])
+        title_lines = [
+            ("DIRECCION DEPARTAMENTAL DE REDES INTEGRADAS DE SERVICIOS DE SALUD", styles["title"]),
+            ("REPORTE QUINCENAL DE INSUMOS / REACTIVOS", styles["title"]),
+            (f"DMS/RED LOCAL: {municipality_label}", styles["centered"]),
+            (date_label, styles["centered"]),
+            (f"Usuario: {username}", styles["centered"]),
+        ]
+        for row_idx, (text, style_name) in enumerate(title_lines, start=5):
+            sheet.merged_cells.add(f"{col_letters[0]}{row_idx}:{col_letters[-1]}{row_idx}")
+            sheet.append([*padding, styled(sheet, text, style_name)])
+        sheet.append([*padding, *[styled(sheet, value, styles["header"]) for value in headers]])
+
+        last_row = table_header_row
+        for values in data_rows:
+            sheet.append([*padding, *[styled(sheet, value, styles["centered"]) for value in values]])
+            last_row += 1
+        sheet.auto_filter.ref = f"{col_letters[0]}{table_header_row}:{col_letters[-1]}{last_row}"
+
+    def general_rows():
+        row_number = 1
+        for municipality_name in ordered_municipality_names:
+            for medication_id, medication_name in medication_items:
+                ingresos_total, egresos_total, stock_total = matrix.get((municipality_name, medication_id), (0, 0, 0))
+                yield [row_number, municipality_name, medication_name, ingresos_total, egresos_total, stock_total]
+                row_number += 1
+
+    def municipality_rows(municipality_name):
+        for medication_id, medication_name in medication_items:
+            ingresos_total, egresos_total, stock_total = matrix.get((municipality_name, medication_id), (0, 0, 0))
+            yield [medication_name, ingresos_total, egresos_total, stock_total]
+
+    write_sheet(
+        wb.create_sheet(title="Detalle general"),
+        "CONSOLIDADO GENERAL",
+        ["No.", "DMS/RED LOCAL", "Insumo", "Ingresos", "Salidas (Egresos)", "Existencia"],
+        [7, 24, 34, 12, 16, 12],
+        general_rows(),
+    )
+
+    # One sheet per municipality with summary
+    for municipality_name in ordered_municipality_names:
+        # Excel sheet title max length 31 and no invalid chars
+        safe_title = "".join(ch for ch in municipality_name if ch not in '\\/*?:[]')
+        safe_title = safe_title[:31] if safe_title else municipality_name
+        write_sheet(
+            wb.create_sheet(title=safe_title),
+            municipality_name,
+            ["Insumo", "Ingresos", "Salidas (Egresos)", "Existencia"],
+            [34, 12, 16, 12],
+            municipality_rows(municipality_name),
+        )
+
+    wb.save(output)
+
+
+CONSOLIDATED_PILL_WIDTHS = [180, 120, 120]
+
+
+def _consolidated_pill_positions(width):
+    total_pills_width = sum(CONSOLIDATED_PILL_WIDTHS) + (len(CONSOLIDATED_PILL_WIDTHS) - 1) * 14
+    x = (width - total_pills_width) / 2
+    positions = []
+    for pill_width in CONSOLIDATED_PILL_WIDTHS:
+        positions.append((x, pill_width))
+        x += pill_width + 14
+    return positions
+
+
+def _draw_consolidated_header_art(canvas_obj):
+    colors = get_pdf_kit().colors
+    width, height = get_pdf_kit().landscape(get_pdf_kit().letter)
+
+    # Top light bar
+    canvas_obj.setFillColor(colors.HexColor("#dcecff"))
+    canvas_obj.rect(0, height - 30, width, 30, fill=1, stroke=0)
+    canvas_obj.setFont("Helvetica-Bold", 10)
+    canvas_obj.setFillColor(colors.HexColor("#0f2c5c"))
+    canvas_obj.drawCentredString(width / 2, height - 20, "DIRECCION DEPARTAMENTAL DE REDES INTEGRADAS DE SERVICIOS DE SALUD")
+
+    # Main title bar
+    canvas_obj.setFillColor(colors.HexColor("#1f4f9c"))
+    canvas_obj.rect(0, height - 95, width, 55, fill=1, stroke=0)
+    canvas_obj.setFillColor(colors.white)
+    canvas_obj.setFont("Helvetica-Bold", 14)
+    canvas_obj.drawCentredString(width / 2, height - 60, "REPORTE QUINCENAL DE")
+    canvas_obj.drawCentredString(width / 2, height - 78, "INSUMOS / REACTIVOS")
+
+    # Info box
+    canvas_obj.setFillColor(colors.HexColor("#eef3fb"))
+    info_top = height - 115
+    info_box_width = width - 120
+    info_box_x = (width - info_box_width) / 2
+    canvas_obj.roundRect(info_box_x, info_top - 45, info_box_width, 45, 8, fill=1, stroke=0)
+    canvas_obj.setFillColor(colors.HexColor("#0f2c5c"))
+    canvas_obj.setFont("Helvetica-Bold", 9)
+    canvas_obj.drawString(info_box_x + 20, info_top - 20, "DMS/RED LOCAL: CONSOLIDADO GENERAL")
+
+    # Summary pills
+    pill_top = info_top - 58
+    canvas_obj.setFillColor(colors.HexColor("#eef3fb"))
+    for x, pill_width in _consolidated_pill_positions(width):
+        canvas_obj.roundRect(x, pill_top - 18, pill_width, 18, 6, fill=1, stroke=0)
+
+
+def render_consolidated_pdf(report_data, username: str, output):
+    kit = get_pdf_kit()
+    Paragraph = kit.Paragraph
+
+    page_size = kit.landscape(kit.letter)
+    doc = kit.SimpleDocTemplate(output, pagesize=page_size, topMargin=20, bottomMargin=20, leftMargin=36, rightMargin=36)
+    elements = []
+
+    medication_items = report_data["medication_items"]
+    ordered_municipality_names = report_data["municipality_names"]
+    matrix = report_data["matrix"]
+
+    date_label = timezone.localdate().strftime("%d/%m/%Y")
+
+    total_movements = report_data["total_movements"]
+    total_ingresos = report_data["total_ingresos"]
+    total_egresos = report_data["total_egresos"]
+
+    data = [["No.", "DMS/RED LOCAL", "Insumo", "Ingresos", "Salidas (Egresos)", "Existencia"]]
+    row_number = 1
+    for municipality_name in ordered_municipality_names:
+        for medication_id, medication_name in medication_items:
+            ingresos_total, egresos_total, stock_total = matrix.get((municipality_name, medication_id), (0, 0, 0))
+            data.append(
+                [
+                    str(row_number),
+                    Paragraph(municipality_name, kit.cell_style),
+                    Paragraph(medication_name, kit.cell_style),
+                    str(ingresos_total),
+                    str(egresos_total),
+                    str(stock_total),
+                ]
+            )
+            row_number += 1
+
+    table = kit.Table(data, hAlign="CENTER", repeatRows=1, colWidths=[30, 150, 250, 65, 85, 85])
+    table.setStyle(kit.consolidated_table_style)
+    elements.append(table)
+
+    def draw_header(canvas_obj, doc_obj):
+        canvas_obj.saveState()
+        draw_static_form(canvas_obj, "consolidated_header", _draw_consolidated_header_art)
+        width, height = page_size
+
+        info_top = height - 115
+        info_box_x = 60
+        canvas_obj.setFillColor(kit.colors.HexColor("#0f2c5c"))
+        canvas_obj.setFont("Helvetica-Bold", 9)
+        right_x = info_box_x + (width - 120) / 2 + 20
+        canvas_obj.drawString(right_x, info_top - 20, f"Fecha: {date_label}")
+        canvas_obj.drawString(info_box_x + 20, info_top - 35, f"Usuario: {username}")
+
+        pill_top = info_top - 58
+        pill_labels = [
+            f"Total de movimientos: {total_movements}",
+            f"Ingresos: {total_ingresos}",
+            f"Egresos: {total_egresos}",
+        ]
+        canvas_obj.setFont("Helvetica-Bold", 8)
+        for label, (x, pill_width) in zip(pill_labels, _consolidated_pill_positions(width)):
+            canvas_obj.drawCentredString(x + pill_width / 2, pill_top - 12, label)
+
+        canvas_obj.restoreState()
+
+    # Leave space for header block
+    elements.insert(0, kit.Spacer(1, 175))
+
+    doc.build(elements, onFirstPage=draw_header)
+
+
+def _draw_dispatch_header_art(canvas_obj):
+    colors = get_pdf_kit().colors
+    width, height = get_pdf_kit().letter
+    header_top = height - 40
+    canvas_obj.setFillColor(colors.HexColor("#1f4f9c"))
+    canvas_obj.rect(0, header_top - 90, width, 90, fill=1, stroke=0)
+    canvas_obj.setFillColor(colors.white)
+    canvas_obj.setFont("Helvetica-Bold", 16)
+    canvas_obj.drawCentredString(width / 2, header_top - 40, "DESPACHO DE INSUMOS")
+    canvas_obj.setFont("Helvetica-Bold", 20)
+    canvas_obj.drawCentredString(width / 2, header_top - 65, "INSUMOS / REACTIVOS")
+
+    canvas_obj.setFillColor(colors.HexColor("#0f2c5c"))
+    canvas_obj.setFont("Helvetica-Bold", 12)
+    canvas_obj.drawCentredString(
+        width / 2,
+        height - 15,
+        "DIRECCION DE AREA DE SALUD DE SOLOLÁ",
+    )
+
+    canvas_obj.setFillColor(colors.HexColor("#eef3fb"))
+    info_box_top = header_top - 105
+    canvas_obj.roundRect(60, info_box_top - 45, width - 120, 45, 8, fill=1, stroke=0)
+
+
+def _draw_dispatch_header(canvas_obj, slip):
+    kit = get_pdf_kit()
+    canvas_obj.saveState()
+    draw_static_form(canvas_obj, "dispatch_header", _draw_dispatch_header_art)
+    width, height = kit.letter
+    info_box_top = height - 145
+    canvas_obj.setFillColor(kit.colors.HexColor("#0f2c5c"))
+    canvas_obj.setFont("Helvetica-Bold", 10)
+    canvas_obj.drawString(80, info_box_top - 20, f"Municipio: {slip['municipality'] or '-'}")
+    canvas_obj.drawString(80, info_box_top - 35, f"Fecha: {slip['date']:%d/%m/%Y}")
+    canvas_obj.drawString(width / 2 + 10, info_box_top - 20, f"Usuario: {slip['username']}")
+    if slip["number"]:
+        canvas_obj.drawString(width / 2 + 10, info_box_top - 35, f"Despacho: {slip['number']}")
+    canvas_obj.restoreState()
+
+
+def render_dispatch_pdf(slips, output):
+    """Dibuja uno o varios despachos en un solo PDF; cada uno inicia pagina.
+
+    Cada despacho es un dict con municipality, date, number, username, notes
+    y rows (codigo, material, cantidad), para poder enviarlo a otro proceso.
+    """
+    kit = get_pdf_kit()
+    Paragraph, Spacer = kit.Paragraph, kit.Spacer
+
+    doc = kit.SimpleDocTemplate(output, pagesize=kit.letter, topMargin=230, bottomMargin=60)
+    elements = []
+
+    for slip in slips:
+        if elements:
+            elements.append(kit.PageBreak())
+        elements.append(kit.PageMarker(lambda canvas_obj, slip=slip: _draw_dispatch_header(canvas_obj, slip)))
+
+        data = [["No.", "Codigo", "Material medico", "Cantidad"]]
+        row_index = 1
+        for code, material_name, quantity in slip["rows"]:
+            data.append([str(row_index), code, material_name, str(quantity)])
+            row_index += 1
+
+        table = kit.Table(data, hAlign="CENTER", colWidths=[35, 70, 360, 70])
+        table.setStyle(kit.dispatch_table_style)
+        elements.append(Spacer(1, 8))
+        elements.append(table)
+        elements.append(Spacer(1, 10))
+        elements.append(Paragraph(f"Observaciones: {slip['notes'] or '-'}", kit.notes_style))
+
+        elements.append(Spacer(1, 18))
+        elements.append(Paragraph("Despacho generado automaticamente por el sistema SISAS", kit.footer_style))
+
+    doc.build(elements)
+
+
+def _init_render_process():
+    # Con spawn (Windows) el proceso hijo arranca sin configuracion de Django.
+    import django
+
+    django.setup()
+
+
+def _render_dispatch_slip(slip) -> bytes:
+    buffer = io.BytesIO()
+    render_dispatch_pdf([slip], buffer)
+    return buffer.getvalue()
+
+
+def render_dispatch_zip(slips, output):
+    """Un PDF por despacho dentro de un zip; los PDF se generan en paralelo."""
+    get_pdf_kit()
+    workers = min(len(slips), os.cpu_count() or 1)
+    if len(slips) < PARALLEL_RENDER_MIN_SLIPS or workers < 2:
+        documents = [_render_dispatch_slip(slip) for slip in slips]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_render_process) as executor:
+            documents = list(executor.map(_render_dispatch_slip, slips))
+
+    with zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as archive:
+        for index, (slip, document) in enumerate(zip(slips, documents), start=1):
+            name = slip["number"] or slip["municipality"] or "municipio"
+            archive.writestr(f"{index:03d}_despacho_{name}_{slip['date']:%Y%m%d}.pdf", document)
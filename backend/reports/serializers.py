@@ -0,0 +1,21 @@
+from rest_framework import serializers
+
+from reports.models import ReportJob
+
+
+class ReportJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ReportJob
+        fields = [
+            "id",
+            "kind",
+            "params",
+            "status",
+            "file_name",
+            "error",
+            "created_at",
+            "started_at",
+            "finished_at",
+            "superseded_by",
+        ]
+        read_only_fields = fields
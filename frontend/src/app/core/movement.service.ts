@@ -4,8 +4,7 @@ import { Injectable } from '@angular/core';
 import { API_BASE_URL } from './api.config';
 import { Movement } from '../shared/models';
 
-interface PaginatedResponse<T> {
-  count: number;
+interface CursorPage<T> {
   next: string | null;
   previous: string | null;
   results: T[];
@@ -19,6 +18,14 @@ interface MovementPayload {
   municipality?: number;
 }
 
+interface DispatchBatchParams {
+  groups?: number[][];
+  date_from?: string;
+  date_to?: string;
+  municipality?: number;
+  format?: 'pdf' | 'zip';
+}
+
 @Injectable({ providedIn: 'root' })
 export class MovementService {
   private readonly baseUrl = `${API_BASE_URL}/movements`;
@@ -26,7 +33,7 @@ export class MovementService {
   constructor(private http: HttpClient) {}
 
   list() {
-    return this.http.get<PaginatedResponse<Movement>>(this.baseUrl + '/');
+    return this.http.get<CursorPage<Movement>>(this.baseUrl + '/');
   }
 
   create(payload: MovementPayload) {
@@ -40,4 +47,8 @@ export class MovementService {
   dispatchReport(ids: number[]) {
     return this.http.post(`${this.baseUrl}/dispatch-report/`, { ids }, { responseType: 'blob' });
   }
+
+  dispatchReportBatch(params: DispatchBatchParams) {
+    return this.http.post(`${this.baseUrl}/dispatch-report/batch/`, params, { responseType: 'blob' });
+  }
 }
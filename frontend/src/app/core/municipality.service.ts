@@ -4,6 +4,15 @@ import { Injectable } from '@angular/core';
 import { API_BASE_URL } from './api.config';
 import { Municipality, MunicipalityStock, MunicipalityStockItem } from '../shared/models';
 
+interface StockAsOfRow {
+  municipality: number;
+  municipality_name: string;
+  medication: number;
+  medication_code: string;
+  medication_name: string;
+  stock: number;
+}
+
 interface PaginatedResponse<T> {
   count: number;
   next: string | null;
@@ -42,4 +51,15 @@ export class MunicipalityService {
       `${API_BASE_URL}/municipality-stocks/summary/`
     );
   }
+
+  getStocksAsOf(date: string, municipalityId?: number) {
+    const params: Record<string, string> = { date };
+    if (municipalityId) {
+      params['municipality'] = String(municipalityId);
+    }
+    return this.http.get<{ date: string; results: StockAsOfRow[] }>(
+      `${API_BASE_URL}/municipality-stocks/as-of/`,
+      { params }
+    );
+  }
 }
@@ -34,7 +34,9 @@ export interface MunicipalityStock {
 }
 
 export interface MunicipalityStockItem {
-  id: number;
+  // null para insumos sin fila de stock en el municipio (existencia 0):
+  // se guardan con setStock(municipio, insumo), no por id.
+  id: number | null;
   municipality: number;
   municipality_name: string;
   medication: number;
@@ -53,5 +55,7 @@ export interface Movement {
   user_name?: string | null;
   quantity: number;
   notes: string;
+  dispatch?: number | null;
+  balance_after?: number | null;
   created_at: string;
 }